@@ -1,8 +1,21 @@
 from django.contrib import admin
-from django.http import HttpResponse, HttpResponseRedirect
-import csv
-from .models import Customer, Category, Size, Product, Order, Payment
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+import tempfile
+from functools import wraps
+from django.core.cache import cache
+from django.db.models import Case, Q, When
+from .models import Customer, Category, Size, Product, Order, Payment, Job
+from .exports import csv_response, model_rows, model_xlsx_response, profit_loss_rows
+from .dispatch import iter_slip_data, write_dispatch_pack
+from .invoice_cache import cached_invoice
+from . import jobs, ledger, search
+from .paginators import CappedCountPaginator
+from .thumbnails import thumbnail_url
+from .recompute import open_orders, recompute_and_sync
 from django.utils.html import format_html
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django import forms
 from django.shortcuts import get_object_or_404
 from django.urls import path, reverse
@@ -10,72 +23,166 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
 
-def export_as_csv_action(description="Export selected rows as CSV"):
+def queue_if_large(kind, **params):
+    # Selections over JOBS_INLINE_MAX_ROWS go to the background job queue (progress page, then download);
+    # smaller ones are still answered by the action itself
+    def decorator(action):
+        @wraps(action)
+        def wrapper(modeladmin, request, queryset):
+            count = queryset.count()
+            if jobs.inline(count):
+                return action(modeladmin, request, queryset)
+            return jobs.start_for_queryset(request, kind, queryset, count, **params)
+        return wrapper
+    return decorator
+
+def export_as_csv_action(description="Export selected rows as CSV", select_related=None):
+    @queue_if_large('model_csv', select_related=select_related)
     def export_as_csv(modeladmin, request, queryset):
         meta = modeladmin.model._meta
-        field_names = [field.name for field in meta.fields]
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename={meta}.csv'
-        writer = csv.writer(response)
-
-        writer.writerow(field_names)
-        for obj in queryset:
-            row = [getattr(obj, field) for field in field_names]
-            writer.writerow(row)
-        return response
+        return csv_response(model_rows(queryset, select_related), f'{meta}.csv')
     export_as_csv.short_description = description
     return export_as_csv
 
+def export_as_xlsx_action(description="Export selected rows as Excel", select_related=None):
+    @queue_if_large('model_xlsx', select_related=select_related)
+    def export_as_xlsx(modeladmin, request, queryset):
+        return model_xlsx_response(queryset, select_related)
+    export_as_xlsx.short_description = description
+    return export_as_xlsx
+
+@queue_if_large('profit_loss_csv')
 def export_profit_loss_csv(modeladmin, request, queryset):
-    orders = queryset
-    total_revenue = sum([o.order_total() for o in orders])
-    total_cost = sum([o.cost_total() for o in orders])
-    total_profit = total_revenue - total_cost
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename=profit_loss.csv'
-    writer = csv.writer(response)
-    writer.writerow(['Total Revenue', 'Total Cost', 'Total Profit'])
-    writer.writerow([str(total_revenue), str(total_cost), str(total_profit)])
-    writer.writerow([])
-    writer.writerow(['Order ID','Customer','Product','Quantity','Product Total','Delivery Cost','Order Total','Profit'])
-    for o in orders:
-        writer.writerow([o.id, o.customer.name, o.product.name, o.quantity, str(o.product_total()), str(o.delivery_cost), str(o.order_total()), str(o.profit())])
-    return response
+    return csv_response(profit_loss_rows(queryset), 'profit_loss.csv')
 export_profit_loss_csv.short_description = "Export Profit/Loss for selected orders (CSV)"
 
+class FullTextSearchMixin:
+    # Admin search through the full-text index; search_index maps a field on this model
+    # to the indexed kind its ids refer to. Falls back to the ORM search when the index
+    # can't answer (unsupported backend, or a word shorter than three characters).
+    search_index = {}
+    search_by_id = False
+
+    def full_text_q(self, search_term):
+        # As ModelAdmin.get_search_results: every word has to match one of the indexed fields
+        query = Q()
+        for word in search_term.split():
+            any_field = Q()
+            for field, kind in self.search_index.items():
+                match = search.matching(kind, word, field)
+                if match is None:
+                    return None
+                any_field |= match
+            query &= any_field
+        return query
+
+    def get_search_results(self, request, queryset, search_term):
+        query = self.full_text_q(search_term) if search_term and self.search_index else None
+        if self.search_by_id and search_term.strip().isdigit():
+            return queryset.filter(Q(pk=int(search_term)) | (query or Q(pk__in=[]))), False
+        if query is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(query), False
+
+class AutocompleteSearchMixin(FullTextSearchMixin):
+    # Autocomplete lookups: prefix matches first, then substring matches, capped at
+    # autocomplete_limit and cached briefly so repeated keystrokes skip the database.
+    autocomplete_limit = 20
+    autocomplete_cache_seconds = 30
+
+    def get_search_results(self, request, queryset, search_term):
+        match = getattr(request, 'resolver_match', None)
+        if not search_term or match is None or match.url_name != 'autocomplete':
+            return super().get_search_results(request, queryset, search_term)
+
+        meta = self.model._meta
+        key = f"autocomplete:{meta.label_lower}:{search_term.lower()}"
+        ids = cache.get(key)
+        if ids is None:
+            ids = self.autocomplete_ids(queryset, search_term)
+            cache.set(key, ids, self.autocomplete_cache_seconds)
+        ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], default=len(ids))
+        return queryset.filter(pk__in=ids).order_by(ranking), False
+
+    def prefix_q(self, search_term):
+        prefix = Q()
+        for field in self.search_fields:
+            prefix |= search.prefix_match(field, search_term)
+        return prefix
+
+    def autocomplete_ids(self, queryset, search_term):
+        limit = self.autocomplete_limit
+        substring = Q()
+        for field in self.search_fields:
+            substring |= Q(**{f"{field}__icontains": search_term})
+        substring = self.full_text_q(search_term) or substring
+        ids = list(queryset.filter(self.prefix_q(search_term)).values_list('pk', flat=True)[:limit])
+        if len(ids) < limit:
+            ids += list(queryset.filter(substring).exclude(pk__in=ids).values_list('pk', flat=True)[:limit - len(ids)])
+        return ids
+
 class PaymentInline(admin.TabularInline):  # or admin.StackedInline for a different layout
     model = Payment
     extra = 1  # Number of empty payment forms to display
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(AutocompleteSearchMixin, admin.ModelAdmin):
     list_display = ('name','email','phone')
-    actions = [export_as_csv_action("Export Customers as CSV")]
+    search_fields = ('name', 'phone', 'email')
+    search_index = {'pk': 'customer'}
+    ordering = ('name',)
+    actions = [export_as_csv_action("Export Customers as CSV"), export_as_xlsx_action("Export Customers as Excel")]
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
+    actions = [export_as_xlsx_action("Export Categories as Excel")]
 
 @admin.register(Size)
 class SizeAdmin(admin.ModelAdmin):
     list_display = ('name',)
+    actions = [export_as_xlsx_action("Export Sizes as Excel")]
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(AutocompleteSearchMixin, admin.ModelAdmin):
     list_display = ('display_name', 'category', 'size', 'cost_price', 'sell_price', 'product_image_preview')  # Use display_name here
-    search_fields = ('name',)
-    actions = [export_as_csv_action("Export Products as CSV")]
+    list_select_related = ('category', 'size')
+    search_fields = ('name', 'display_name')
+    search_index = {'pk': 'product'}
+    ordering = ('display_name',)
+    actions = [export_as_csv_action("Export Products as CSV"), export_as_xlsx_action("Export Products as Excel"),
+               "reprice_pending_orders"]
     readonly_fields = ('display_name', 'product_image_preview') # Added this line
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and {'cost_price', 'sell_price'} & set(form.changed_data):
+            updated = recompute_and_sync(open_orders([obj]), products=[obj.pk], reprice=True)
+            if updated:
+                self.message_user(request, f"New prices applied to {updated} pending orders.")
+
+    def reprice_pending_orders(self, request, queryset):
+        products = list(queryset.values_list('pk', flat=True))
+        updated = recompute_and_sync(open_orders(products), products=products, reprice=True)
+        self.message_user(request, f"Current prices applied to {updated} pending orders.")
+    reprice_pending_orders.short_description = "Apply current prices to pending orders"
+
     def product_image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" loading="lazy" />', thumbnail_url(obj.image))
         return "No Image"
     product_image_preview.short_description = 'Image Preview'
     product_image_preview.allow_tags = True
 
+class OrderImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or XLSX")
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if upload.name.rsplit('.', 1)[-1].lower() not in ('csv', 'xlsx'):
+            raise forms.ValidationError("Upload a .csv or .xlsx file.")
+        return upload
+
 class OrderChangeForm(forms.ModelForm):
     class Meta:
         model = Order
@@ -86,23 +193,38 @@ class OrderChangeForm(forms.ModelForm):
         self.fields['product'].label_from_instance = lambda obj: obj.display_name
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('id', 'customer', 'product_display_name', 'quantity', 'order_total_display', 'order_image_preview',
                     'payment_status', 'order_status', 'created_at', 'other_expense', 'profit_amount') # ADDED other expense
     list_filter = ('order_status', 'payment_status', 'created_at', 'product__category')
+    list_select_related = ('customer', 'product', 'product__category')
+    ordering = ('-created_at', '-id')  # served by the order_created_id / status indexes
+    list_per_page = 100
+    paginator = CappedCountPaginator
+    show_full_result_count = False
     search_fields = ('customer__name', 'product__name')
-    actions = [export_as_csv_action("Export Orders as CSV"), export_profit_loss_csv, "download_invoice"]
+    search_index = {'customer': 'customer', 'product': 'product'}
+    search_by_id = True
+    autocomplete_fields = ('customer', 'product')
+    actions = [export_as_csv_action("Export Orders as CSV"), export_as_xlsx_action("Export Orders as Excel"),
+               export_profit_loss_csv, "download_invoice",
+               "download_invoices_zip", "download_invoices_merged", "download_dispatch_pack",
+               "mark_refunded", "clear_refund"]
     inlines = [PaymentInline]
+    # Payment figures are kept up to date by the payment ledger
+    readonly_fields = ('unit_sell_price', 'unit_cost_price', 'received_amount', 'pending_amount', 'payment_status')
     form = OrderChangeForm
     change_form_template = 'admin/order_change_form.html'
+    change_list_template = 'admin/order_change_list.html'
 
     def product_display_name(self, obj):
         return obj.product.display_name  # Retrieve from the display_name field
     product_display_name.short_description = 'Product'
+    product_display_name.admin_order_field = 'product__display_name'
 
     def order_image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" loading="lazy" />', thumbnail_url(obj.image))
         return "No Image"
     order_image_preview.short_description = 'Image Preview'  # Added here
     order_image_preview.allow_tags = True #Added here
@@ -112,8 +234,9 @@ class OrderAdmin(admin.ModelAdmin):
     product_total_display.short_description = 'Product Total'
 
     def order_total_display(self, obj):
-        return obj.order_total()
+        return obj.total  # stored by Order.save()
     order_total_display.short_description = 'Order Total'
+    order_total_display.admin_order_field = 'total'
 
     def profit_display(self, obj):
         return obj.profit()
@@ -122,14 +245,38 @@ class OrderAdmin(admin.ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('<int:order_id>/invoice/', self.admin_site.admin_view(self.download_invoice_view), name="order-invoice"),
+            path('<int:order_id>/invoice/', self.admin_site.admin_view(self.download_invoice_view, cacheable=True), name="order-invoice"),
             path('<int:order_id>/delivery_slip/', self.admin_site.admin_view(self.delivery_slip_view), name="chococroco_order-delivery-slip"),
+            path('import/', self.admin_site.admin_view(self.import_view), name="chococroco_order_import"),
         ]
         return custom_urls + urls
 
     def download_invoice_view(self, request, order_id, *args, **kwargs):
-        order = get_object_or_404(Order, pk=order_id)
-        return order.generate_invoice()
+        order = get_object_or_404(Order.objects.select_related('customer', 'product'), pk=order_id)
+        # Only the content ETag: customer and product renames change the PDF without touching updated_at
+        handle, digest = cached_invoice(order)
+        etag = f'"{digest}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(handle, as_attachment=True, filename=f"invoice_{order.id}.pdf")
+        else:
+            handle.close()
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def import_view(self, request):
+        # The rows are imported by run_jobs; the progress page offers the rejected rows as a CSV
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = OrderImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            file_format = upload.name.rsplit('.', 1)[-1].lower()
+            return jobs.start(request, 'import_orders', upload=jobs.save_upload(upload), file_format=file_format)
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form,
+                       title="Import orders")
+        return TemplateResponse(request, 'admin/order_import.html', context)
 
     def delivery_slip_view(self, request, order_id, *args, **kwargs):
         order = get_object_or_404(Order, pk=order_id)
@@ -173,15 +320,40 @@ class OrderAdmin(admin.ModelAdmin):
         self.message_user(request, "Please select exactly one order.")
     download_invoice.short_description = "Download Invoice PDF"
 
+    # Invoice batches render in a process pool, which belongs in run_jobs rather than a web request,
+    # so these always go through the job queue
+    def download_invoices_zip(self, request, queryset):
+        return jobs.start_for_queryset(request, 'invoices_zip', queryset, queryset.count())
+    download_invoices_zip.short_description = "Download Invoices for selected orders (ZIP)"
+
+    def download_invoices_merged(self, request, queryset):
+        return jobs.start_for_queryset(request, 'invoices_pdf', queryset, queryset.count())
+    download_invoices_merged.short_description = "Download Invoices for selected orders (single PDF)"
+
+    @queue_if_large('dispatch_pack')
+    def download_dispatch_pack(self, request, queryset):
+        output = tempfile.TemporaryFile()
+        write_dispatch_pack(iter_slip_data(queryset), output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename="dispatch.zip")
+    download_dispatch_pack.short_description = "Download delivery labels + manifest for selected orders (ZIP)"
+
+    def mark_refunded(self, request, queryset):
+        # payment_status is read-only on the form; refunds are the one status staff set by hand
+        count = ledger.mark_refunded(queryset)
+        self.message_user(request, f"{count} orders marked as refunded.")
+    mark_refunded.short_description = "Mark selected orders as refunded"
+
+    def clear_refund(self, request, queryset):
+        count = ledger.clear_refund(queryset)
+        self.message_user(request, f"{count} refunds cleared; payment status follows the payments again.")
+    clear_refund.short_description = "Clear refund on selected orders"
+
     def change_view(self, request, object_id, form_url='', extra_context=None):
         extra_context = extra_context or {}
-        order = get_object_or_404(Order, pk=object_id)
-        invoice_url = reverse('admin:order-invoice', args=[order.pk])
-        delivery_slip_url = reverse('admin:chococroco_order-delivery-slip', args=[order.pk])
-        extra_context['invoice_url'] = invoice_url
-        extra_context['delivery_slip_url'] = delivery_slip_url
-        form = OrderChangeForm(instance=order)
-        extra_context['form'] = form
+        if object_id.isdigit():
+            extra_context['invoice_url'] = reverse('admin:order-invoice', args=[object_id])
+            extra_context['delivery_slip_url'] = reverse('admin:chococroco_order-delivery-slip', args=[object_id])
         return super().change_view(request, object_id, form_url, extra_context=extra_context)
 
     def save_model(self, request, obj, form, change):
@@ -196,4 +368,34 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id','order','amount','method','payment_date')
-    actions = [export_as_csv_action("Export Payments as CSV")]
+    list_select_related = ('order__customer',)
+    actions = [export_as_csv_action("Export Payments as CSV", select_related=('order__customer',)),
+               export_as_xlsx_action("Export Payments as Excel", select_related=('order__customer',))]
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_title', 'status', 'progress_display', 'created_by', 'created_at', 'finished_at',
+                    'job_link')
+    list_filter = ('status', 'kind')
+    list_select_related = ('created_by',)
+    readonly_fields = [field.name for field in Job._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def job_title(self, obj):
+        return jobs.title(obj.kind)
+    job_title.short_description = "Job"
+
+    def progress_display(self, obj):
+        return f"{obj.percent}% ({obj.progress}/{obj.total})" if obj.total else f"{obj.percent}%"
+    progress_display.short_description = "Progress"
+
+    def job_link(self, obj):
+        label = "Download" if obj.status == 'done' else "Progress"
+        target = 'job_download' if obj.status == 'done' else 'job_progress'
+        return format_html('<a href="{}">{}</a>', reverse(target, args=[obj.pk]), label)
+    job_link.short_description = ""
@@ -0,0 +1,162 @@
+from decimal import Decimal
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .models import Category, Product
+from .reports import report_db
+
+TOP_N = 5
+CHUNK_SIZE = 50000
+
+# Period name -> (pandas frequency, label format applied to the first day)
+PERIODS = {
+    'day': ('D', '%Y-%m-%d'),
+    'week': ('W-SUN', '%Y-%m-%d'),
+    'month': ('M', '%Y-%m'),
+    'quarter': ('Q', '%Y-Q%q'),
+    'year': ('Y', '%Y'),
+}
+
+MONEY_FIELDS = ('unit_sell_price', 'unit_cost_price', 'delivery_cost', 'other_expense')
+COLUMNS = ('created_at', 'customer_id', 'product_id', 'quantity') + MONEY_FIELDS
+FIGURES = ('revenue', 'cost', 'profit', 'quantity')
+
+
+def paise(values):
+    # Decimal amounts with two places -> exact integer paise
+    return np.rint(np.fromiter(map(float, values), np.float64, len(values)) * 100).astype(np.int64)
+
+
+def money(value):
+    return Decimal(int(round(value))).scaleb(-2)
+
+
+def percent(part, whole):
+    return round(float(part) * 100 / float(whole), 2) if whole else 0.0
+
+
+def typed_chunk(rows):
+    # One block of values_list() tuples -> typed columns (created_at as epoch seconds), so no Python
+    # objects are kept around
+    columns = dict(zip(COLUMNS, zip(*rows)))
+    chunk = {
+        'created_at': np.fromiter((value.timestamp() for value in columns['created_at']), np.float64, len(rows)),
+        'customer_id': np.array(columns['customer_id'], dtype=np.int64),
+        'product_id': np.array(columns['product_id'], dtype=np.int64),
+        'quantity': np.array(columns['quantity'], dtype=np.int64),
+    }
+    for field in MONEY_FIELDS:
+        chunk[field] = paise(columns[field])
+    return pd.DataFrame(chunk)
+
+
+def frame(rows, chunk_size=CHUNK_SIZE):
+    rows = iter(rows)
+    chunks = []
+    while True:
+        block = list(islice(rows, chunk_size))
+        if not block:
+            break
+        chunks.append(typed_chunk(block))
+    return combine(chunks)
+
+
+def combine(chunks):
+    if not chunks:
+        chunks.append(pd.DataFrame({
+            'created_at': np.array([], dtype=np.float64),
+            **{column: np.array([], dtype=np.int64) for column in COLUMNS[1:]},
+        }))
+    df = pd.concat(chunks, ignore_index=True)
+    created_at = pd.Series(np.rint(df['created_at'].to_numpy() * 1e6).astype(np.int64).astype('datetime64[us]'))
+    df['created_at'] = created_at.dt.tz_localize('UTC').dt.tz_convert(settings.TIME_ZONE).dt.tz_localize(None)
+    # Same formulas as Order.order_total(), cost_total() and profit(), in integer paise
+    product_total = df['unit_sell_price'] * df['quantity']
+    df['revenue'] = product_total + df['delivery_cost']
+    df['cost'] = df['unit_cost_price'] * df['quantity'] + df['delivery_cost'] + df['other_expense']
+    df['profit'] = (df['unit_sell_price'] - df['unit_cost_price']) * df['quantity'] - df['other_expense']
+    return df
+
+
+def order_frame(orders):
+    rows = orders.order_by().values_list(*COLUMNS).iterator(chunk_size=CHUNK_SIZE)
+    df = frame(rows)
+    categories = dict(Product.objects.using(orders.db).filter(pk__in=df['product_id'].unique().tolist())
+                      .values_list('pk', 'category_id'))
+    df['category_id'] = df['product_id'].map(categories).fillna(0).astype(np.int64)
+    return df
+
+
+def metrics(df, by):
+    # Revenue, cost, profit, AOV, margin and repeat-customer rate per group
+    grouped = df.groupby(by, sort=True)
+    table = grouped[list(FIGURES)].sum()
+    table['orders'] = grouped.size()
+    orders_per_customer = df.groupby([by, 'customer_id']).size()
+    table['customers'] = orders_per_customer.groupby(level=0).size()
+    table['repeat_customers'] = (orders_per_customer > 1).groupby(level=0).sum()
+    return table
+
+
+def figures(row):
+    return {
+        'orders': int(row['orders']),
+        'quantity': int(row['quantity']),
+        'revenue': money(row['revenue']),
+        'cost': money(row['cost']),
+        'profit': money(row['profit']),
+        'margin': percent(row['profit'], row['revenue']),
+        'aov': money(row['revenue'] / row['orders']) if row['orders'] else Decimal('0.00'),
+        'customers': int(row['customers']),
+        'repeat_customer_rate': percent(row['repeat_customers'], row['customers']),
+    }
+
+
+def ranked(df, by, names, top):
+    # Best sellers by revenue within each period
+    sums = df.groupby(['period', by])[['revenue', 'profit', 'quantity']].sum()
+    best = sums.sort_values('revenue', ascending=False, kind='stable').groupby(level=0).head(top)
+    result = {}
+    for (period, key), row in best.iterrows():
+        result.setdefault(period, []).append({
+            'name': names.get(key, '(none)'),
+            'revenue': money(row['revenue']),
+            'profit': money(row['profit']),
+            'quantity': int(row['quantity']),
+        })
+    return result
+
+
+def summary(df, period='month', top=TOP_N):
+    freq, label = PERIODS[period]
+    df = df.assign(period=df['created_at'].dt.to_period(freq))
+    product_ids = df['product_id'].unique().tolist()
+    category_ids = df['category_id'].unique().tolist()
+    product_names = dict(Product.objects.using(report_db()).filter(pk__in=product_ids)
+                         .values_list('pk', 'display_name'))
+    category_names = dict(Category.objects.using(report_db()).filter(pk__in=category_ids).values_list('pk', 'name'))
+
+    totals = metrics(df.assign(everything=0), 'everything')
+    per_period = metrics(df, 'period')
+    top_products = ranked(df, 'product_id', product_names, top)
+    top_categories = ranked(df, 'category_id', category_names, top)
+    overall = df.assign(period=0)
+
+    return {
+        'period': period,
+        'totals': figures(totals.iloc[0] if len(totals) else pd.Series(0, index=totals.columns)),
+        'top_products': ranked(overall, 'product_id', product_names, top).get(0, []),
+        'top_categories': ranked(overall, 'category_id', category_names, top).get(0, []),
+        'periods': [
+            {
+                'period': key.asfreq('D', 'start').strftime(label),
+                **figures(row),
+                'top_products': top_products.get(key, []),
+                'top_categories': top_categories.get(key, []),
+            }
+            for key, row in per_period.iterrows()
+        ],
+    }
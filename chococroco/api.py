@@ -0,0 +1,151 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags, quote_etag
+from django_filters import rest_framework as filters
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.routers import DefaultRouter
+
+from .models import Customer, Order, Payment, Product
+from .serializers import (MAX_BULK_ITEMS, CustomerSerializer, OrderSerializer, PaymentSerializer, ProductSerializer,
+                          as_id, requested_fields)
+
+
+class Pagination(CursorPagination):
+    # Keyset pages in each viewset's cursor_ordering, so deep pages cost the same as the first
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        for param, ordering in view.filtered_ordering.items():
+            if param in request.query_params:
+                return ordering
+        return view.cursor_ordering
+
+
+def etag_for(data):
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return quote_etag(hashlib.md5(body.encode()).hexdigest())
+
+
+class ApiViewSet(viewsets.ModelViewSet):
+    pagination_class = Pagination
+    filter_backends = [filters.DjangoFilterBackend]
+    cursor_ordering = ('-id',)
+    filtered_ordering = {}  # query parameter -> cursor ordering used when it is given
+    related = {}  # representation field -> select_related path it reads
+
+    def get_queryset(self):
+        # Only join what the requested fields need
+        fields = requested_fields(self.request)
+        paths = [path for name, path in self.related.items() if fields is None or name in fields]
+        return self.queryset.select_related(*paths) if paths else self.queryset.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        # Conditional GET: the ETag is a digest of the representation, so a match answers 304 without a body
+        response = super().retrieve(request, *args, **kwargs)
+        etag = etag_for(response.data)
+        etags = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if etag in etags or '*' in etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        # POST a list of new objects, or PATCH a list of partial objects with their "id"; one transaction each
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        serializer = self.get_serializer(self.bulk_instances(request.data), data=request.data, many=True,
+                                         partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    def bulk_instances(self, items):
+        # Rows for a bulk update, in the order of the items
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValidationError("Expected a list of objects.")
+        if len(items) > MAX_BULK_ITEMS:
+            raise ValidationError(f"At most {MAX_BULK_ITEMS} objects per request.")
+        ids = [as_id(item.get('id')) for item in items]
+        if None in ids:
+            raise ValidationError("Every object needs its integer \"id\".")
+        if len(set(ids)) != len(ids):
+            raise ValidationError("Each id may appear only once.")
+        found = self.get_queryset().in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise ValidationError({'id': [f"Not found: {', '.join(map(str, missing[:20]))}"]})
+        return [found[pk] for pk in ids]
+
+
+class OrderFilter(filters.FilterSet):
+    # Plain id filters, so the browsable API does not render a select of every customer / product
+    customer = filters.NumberFilter(field_name='customer_id')
+    product = filters.NumberFilter(field_name='product_id')
+
+    class Meta:
+        model = Order
+        fields = {
+            'created_at': ['gte', 'lt'],
+            'updated_at': ['gte'],
+            'order_status': ['exact'],
+            'payment_status': ['exact'],
+        }
+
+
+class PaymentFilter(filters.FilterSet):
+    order = filters.NumberFilter(field_name='order_id')
+
+    class Meta:
+        model = Payment
+        fields = {
+            'payment_date': ['gte', 'lt'],
+            'method': ['exact'],
+        }
+
+
+class CustomerViewSet(ApiViewSet):
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    filterset_fields = ('phone', 'email')
+
+
+class ProductViewSet(ApiViewSet):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    filterset_fields = ('category', 'size')
+
+
+class OrderViewSet(ApiViewSet):
+    queryset = Order.objects.all()
+    serializer_class = OrderSerializer
+    cursor_ordering = ('-created_at', '-id')
+    # Change polling pages in update order, along the order_updated_id index
+    filtered_ordering = {'updated_at__gte': ('updated_at', 'id')}
+    related = {'customer_name': 'customer', 'product_name': 'product'}
+    filterset_class = OrderFilter
+
+
+class PaymentViewSet(ApiViewSet):
+    queryset = Payment.objects.all()
+    serializer_class = PaymentSerializer
+    cursor_ordering = ('-payment_date', '-id')
+    filterset_class = PaymentFilter
+
+
+router = DefaultRouter()
+router.register('customers', CustomerViewSet)
+router.register('products', ProductViewSet)
+router.register('orders', OrderViewSet)
+router.register('payments', PaymentViewSet)
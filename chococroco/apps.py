@@ -2,3 +2,6 @@ from django.apps import AppConfig
 class ChococrocoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chococroco'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,97 @@
+import csv
+import io
+import itertools
+import shutil
+import tempfile
+import zipfile
+
+from .profiling import span
+
+LABELS_PER_PAGE = 8  # 2 x 4 grid on A4
+LABELS_PER_PART = 1000  # labels per PDF in a dispatch pack (125 pages), which bounds the renderer's memory
+
+MANIFEST_HEADER = ['Sheet', 'Sheet Page', 'Order ID', 'Date', 'Customer', 'Phone', 'Address', 'Product', 'Quantity',
+                   'Order Total', 'Received', 'To Collect', 'Order Status', 'Payment Status']
+
+
+def slip_data(order):
+    # Plain values for one label / manifest line
+    customer, product = order.customer, order.product
+    return {
+        'id': order.id,
+        'date': order.created_at.strftime('%d-%m-%Y'),
+        'customer_name': customer.name,
+        'customer_phone': customer.phone or '',
+        'customer_address': customer.address or '',
+        'product': product.display_name or product.name,
+        'quantity': order.quantity,
+        'total': f"{order.total:.2f}",
+        'received': f"{order.received_amount:.2f}",
+        'pending': f"{order.pending_amount:.2f}",
+        'order_status': order.get_order_status_display(),
+        'payment_status': order.get_payment_status_display(),
+    }
+
+
+def iter_slip_data(orders, chunk_size=500):
+    # Customers and products come from the same joined query, streamed in chunks
+    orders = orders.select_related('customer', 'product').order_by('created_at', 'id')
+    for order in orders.iterator(chunk_size=chunk_size):
+        yield slip_data(order)
+
+
+def manifest_row(slip, sheet, page):
+    return [sheet, page, slip['id'], slip['date'], slip['customer_name'], slip['customer_phone'], slip['customer_address'],
+            slip['product'], slip['quantity'], slip['total'], slip['received'], slip['pending'],
+            slip['order_status'], slip['payment_status']]
+
+
+def renderer():
+    from . import dispatch_pdf
+    return dispatch_pdf
+
+
+def part_name(number):
+    return f"labels-{number:03d}.pdf"
+
+
+def write_dispatch_pack(slips, output):
+    # ZIP with the label sheets, LABELS_PER_PART labels per PDF, and manifest.csv, built in one pass. ReportLab
+    # keeps a sheet's pages until it is saved, so each part is rendered to a temp file and copied into the archive
+    # before the next starts. Returns the label count.
+    slips = iter(slips)
+    count = 0
+    with tempfile.TemporaryFile() as manifest, zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        text = io.TextIOWrapper(manifest, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(MANIFEST_HEADER)
+
+        def listed(part, name):
+            for index, slip in enumerate(part):
+                writer.writerow(manifest_row(slip, name, index // LABELS_PER_PAGE + 1))
+                yield slip
+
+        number = 0
+        while True:
+            first = next(slips, None)
+            if first is None and number:
+                break
+            number += 1
+            name = part_name(number)
+            # An empty selection still gets one sheet, saying there is nothing to dispatch
+            part = [] if first is None else itertools.chain([first], itertools.islice(slips, LABELS_PER_PART - 1))
+            with tempfile.TemporaryFile() as pdf:
+                with span('pdf_render'):
+                    count += renderer().render_labels(listed(part, name), pdf, per_page=LABELS_PER_PAGE)
+                pdf.seek(0)
+                with archive.open(name, 'w') as member:
+                    shutil.copyfileobj(pdf, member)
+            if first is None:
+                break
+
+        text.flush()
+        manifest.seek(0)
+        with archive.open('manifest.csv', 'w') as member:
+            shutil.copyfileobj(manifest, member)
+        text.detach()
+    return count
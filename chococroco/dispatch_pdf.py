@@ -0,0 +1,75 @@
+# ReportLab label sheets, imported on first use through chococroco.dispatch.renderer()
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen.canvas import Canvas
+
+from .invoice_pdf import get_styles
+
+COMPANY = "ChocoCroco Pvt Ltd"
+RETURN_ADDRESS = "123, Sweet Street, Chennai, India  |  +91-9876543210"
+COLUMNS = 2
+MARGIN = 6 * mm
+PADDING = 5 * mm
+
+
+def draw_label(canvas, x, y, width, height, slip):
+    canvas.setDash(3, 3)
+    canvas.rect(x, y, width, height)  # cut line
+    canvas.setDash()
+    left, top = x + PADDING, y + height - PADDING
+    inner = width - 2 * PADDING
+
+    canvas.setFont('Helvetica-Bold', 9)
+    canvas.drawString(left, top - 9, COMPANY)
+    canvas.drawRightString(left + inner, top - 9, f"Order #{slip['id']}")
+    canvas.setFont('Helvetica', 7)
+    canvas.drawString(left, top - 18, RETURN_ADDRESS)
+    canvas.line(left, top - 22, left + inner, top - 22)
+
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(left, top - 33, "DELIVER TO")
+    canvas.setFont('Helvetica-Bold', 12)
+    canvas.drawString(left, top - 47, slip['customer_name'][:40])
+    canvas.setFont('Helvetica', 10)
+    line_y = top - 60
+    for line in simpleSplit(slip['customer_address'], 'Helvetica', 10, inner)[:4]:
+        canvas.drawString(left, line_y, line)
+        line_y -= 12
+    if slip['customer_phone']:
+        canvas.drawString(left, line_y, f"Phone: {slip['customer_phone']}")
+
+    bottom = y + PADDING
+    canvas.line(left, bottom + 26, left + inner, bottom + 26)
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(left, bottom + 15, f"{slip['product'][:45]}  x {slip['quantity']}")
+    canvas.drawString(left, bottom + 4, f"Date: {slip['date']}")
+    canvas.setFont('Helvetica-Bold', 9)
+    due = f"COLLECT Rs. {slip['pending']}" if slip['pending'] not in ('0.00', '-0.00') else "PREPAID"
+    canvas.drawRightString(left + inner, bottom + 4, due)
+
+
+def render_labels(slips, output, per_page=8):
+    # Draws straight onto a canvas: finished pages are kept only as compressed page streams
+    get_styles()  # same per-process font setup as the invoices
+    canvas = Canvas(output, pagesize=A4, pageCompression=1)
+    canvas.setTitle("Dispatch labels")
+    page_width, page_height = A4
+    rows = per_page // COLUMNS
+    width = (page_width - 2 * MARGIN) / COLUMNS
+    height = (page_height - 2 * MARGIN) / rows
+    count = 0
+    for slip in slips:
+        if count and count % per_page == 0:
+            canvas.showPage()
+        position = count % per_page
+        column, row = position % COLUMNS, position // COLUMNS
+        x = MARGIN + column * width
+        y = page_height - MARGIN - (row + 1) * height
+        draw_label(canvas, x, y, width, height, slip)
+        count += 1
+    if not count:
+        canvas.setFont('Helvetica', 12)
+        canvas.drawString(MARGIN, page_height - MARGIN - 12, "No orders to dispatch.")
+    canvas.save()
+    return count
@@ -0,0 +1,206 @@
+import csv
+import io
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Count, DateField, DateTimeField, DecimalField, Max, Min, Model, Sum, Value
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .reports import MONEY, ORDER_COST, ORDER_PROFIT, ORDER_TOTAL, PRODUCT_TOTAL, order_totals
+
+CHUNK_SIZE = 2000
+XLSX_MONEY_FORMAT = '#,##0.00'
+XLSX_DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+
+class Echo:
+    # File-like object for csv.writer that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def money(value):
+    return f"{value:.2f}"
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def csv_response(rows, filename):
+    response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def write_csv(rows, output):
+    # Same CSV into a binary file, for background jobs
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    csv.writer(text).writerows(rows)
+    text.flush()
+    text.detach()
+
+
+def model_rows(queryset, select_related=None):
+    meta = queryset.model._meta
+    field_names = [field.name for field in meta.fields]
+    if select_related is None:
+        select_related = [field.name for field in meta.fields if field.is_relation]
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+
+    yield field_names
+    for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield [getattr(obj, field) for field in field_names]
+
+
+def profit_loss_totals(orders):
+    zero = Value(0, output_field=MONEY)
+    totals = orders.order_by().aggregate(
+        revenue=Coalesce(Sum(ORDER_TOTAL), zero),
+        cost=Coalesce(Sum(ORDER_COST), zero),
+    )
+    totals['profit'] = totals['revenue'] - totals['cost']
+    return totals
+
+
+def profit_loss_rows(orders):
+    # Summary section from one aggregate, then one row per order read in chunks
+    totals = profit_loss_totals(orders)
+    yield ['Total Revenue', 'Total Cost', 'Total Profit']
+    yield [money(totals['revenue']), money(totals['cost']), money(totals['profit'])]
+    yield []
+    yield ['Order ID', 'Customer', 'Product', 'Quantity', 'Product Total', 'Delivery Cost', 'Order Total', 'Profit']
+    rows = orders.annotate(
+        line_total=PRODUCT_TOTAL,
+        grand_total=ORDER_TOTAL,
+        line_profit=ORDER_PROFIT,
+    ).values_list('id', 'customer__name', 'product__name', 'quantity', 'line_total', 'delivery_cost',
+                  'grand_total', 'line_profit')
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield [row[0], row[1], row[2], row[3], money(row[4]), money(row[5]), money(row[6]), money(row[7])]
+
+
+def cents(value):
+    # Database sums of money columns can carry float noise on SQLite
+    return (value or Decimal(0)).quantize(Decimal('0.01'))
+
+
+def xlsx_value(value):
+    # Numbers and dates stay typed; Excel has no time zones, so datetimes become naive local time
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    if isinstance(value, Model):
+        return str(value)
+    if isinstance(value, FieldFile):
+        return value.name or None
+    return value
+
+
+def xlsx_row(sheet, values, bold=False):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    row = []
+    for value in values:
+        value = xlsx_value(value)
+        if bold or isinstance(value, (Decimal, datetime)):
+            cell = WriteOnlyCell(sheet, value)
+            if bold:
+                cell.font = Font(bold=True)
+            elif isinstance(value, Decimal):
+                cell.number_format = XLSX_MONEY_FORMAT
+            else:
+                cell.number_format = XLSX_DATETIME_FORMAT
+            value = cell
+        row.append(value)
+    return row
+
+
+def write_xlsx(sheets, output):
+    # sheets: (title, rows) with the header as the first row. openpyxl's write-only mode streams each sheet
+    # to a temporary file, and the workbook is assembled in output, so memory does not grow with the rows.
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    for title, rows in sheets:
+        sheet = workbook.create_sheet(title[:31])
+        for index, row in enumerate(rows):
+            sheet.append(xlsx_row(sheet, row, bold=index == 0))
+    workbook.save(output)
+
+
+def xlsx_response(sheets, filename):
+    output = tempfile.TemporaryFile()
+    write_xlsx(sheets, output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename)
+
+
+def summary_rows(queryset):
+    # Row count, money totals and date range of the exported rows, from one aggregate
+    fields = queryset.model._meta.fields
+    money = [field for field in fields if isinstance(field, DecimalField)]
+    dates = [field for field in fields if isinstance(field, (DateField, DateTimeField))]
+    aggregates = {'rows': Count('pk')}
+    for field in money:
+        aggregates[f'sum_{field.name}'] = Sum(field.name)
+    for field in dates:
+        aggregates[f'min_{field.name}'] = Min(field.name)
+        aggregates[f'max_{field.name}'] = Max(field.name)
+    result = queryset.order_by().aggregate(**aggregates)
+
+    yield ['Figure', 'Value']
+    yield ['Rows', result['rows']]
+    for field in money:
+        yield [f'Total {field.verbose_name}', cents(result[f'sum_{field.name}'])]
+    for field in dates:
+        yield [f'First {field.verbose_name}', result[f'min_{field.name}']]
+        yield [f'Last {field.verbose_name}', result[f'max_{field.name}']]
+
+
+def model_sheets(queryset, select_related=None):
+    meta = queryset.model._meta
+    return [
+        ('Summary', summary_rows(queryset)),
+        (str(meta.verbose_name_plural).capitalize(), model_rows(queryset, select_related)),
+    ]
+
+
+def model_xlsx_response(queryset, select_related=None):
+    return xlsx_response(model_sheets(queryset, select_related), f'{queryset.model._meta}.xlsx')
+
+
+def report_summary_rows(orders, filters):
+    yield ['Figure', 'Value']
+    for name, value in filters.items():
+        yield [f"Filter: {name.replace('_', ' ')}", value or 'any']
+    totals = order_totals(orders)
+    yield ['Orders', totals['order_count']]
+    yield ['Total sales', cents(totals['total_sales'])]
+    yield ['Total cost', cents(totals['total_cost'])]
+    yield ['Total profit', cents(totals['total_profit'])]
+    by_status = orders.order_by().values_list('order_status').annotate(count=Count('id'), sales=Sum('total'))
+    for status, count, sales in by_status.order_by('order_status'):
+        yield [f'{status.capitalize()} orders', count]
+        yield [f'{status.capitalize()} sales', cents(sales)]
+
+
+def report_rows(orders):
+    yield ['Order ID', 'Customer', 'Product', 'Quantity', 'Delivery Cost', 'Other Expense', 'Total',
+           'Received Amount', 'Pending Amount', 'Order Status', 'Payment Status', 'Created At', 'Profit']
+    rows = orders.order_by('-created_at', '-id').values_list(
+        'id', 'customer__name', 'product__name', 'quantity', 'delivery_cost', 'other_expense', 'total',
+        'received_amount', 'pending_amount', 'order_status', 'payment_status', 'created_at', 'profit_amount')
+    yield from rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def report_sheets(orders, filters):
+    return [
+        ('Summary', report_summary_rows(orders, filters)),
+        ('Orders', report_rows(orders)),
+    ]
@@ -0,0 +1,300 @@
+import csv
+import io
+import time
+from datetime import datetime, time as day_time
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import report_cache, rollups, search
+from .models import Category, Customer, Order, Payment, Product, Size
+
+BATCH_SIZE = 2000
+STATUSES = {choice for choice, _ in Order.STATUS_CHOICES}
+MONEY_COLUMNS = ('delivery_cost', 'other_expense', 'received_amount', 'sell_price', 'cost_price')
+MAX_MONEY = Decimal(10) ** 8  # max_digits=10, decimal_places=2
+MAX_QUANTITY = 2147483647  # PositiveIntegerField
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.customers_created = 0
+        self.products_created = 0
+        self.errors = []  # (row number, message)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"{self.created} orders imported, {len(self.errors)} rows rejected, "
+                f"{self.customers_created} new customers, {self.products_created} new products "
+                f"in {self.elapsed:.2f}s ({self.rate:.0f} orders/sec)")
+
+
+def read_csv(handle):
+    if isinstance(handle, (bytes, bytearray)):
+        handle = io.StringIO(handle.decode('utf-8-sig'))
+    elif not isinstance(handle, io.TextIOBase):
+        handle = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='')
+    for row in csv.DictReader(handle):
+        yield {(key or '').strip().lower(): value for key, value in row.items()}
+
+
+def read_xlsx(handle):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(handle, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+        for values in rows:
+            if any(value not in (None, '') for value in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(handle, file_format):
+    return read_xlsx(handle) if file_format == 'xlsx' else read_csv(handle)
+
+
+def text(value):
+    return '' if value is None else str(value).strip()
+
+
+def money(value, default='0'):
+    value = text(value) or default
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"not a number: {value!r}")
+    # NaN and Infinity parse, but can't be stored or turned into paise
+    if not amount.is_finite() or abs(amount) >= MAX_MONEY:
+        raise ValueError(f"amount out of range: {value!r}")
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_created_at(value):
+    if isinstance(value, datetime):
+        moment = value
+    elif not text(value):
+        return timezone.now()
+    else:
+        moment = parse_datetime(text(value))
+        if moment is None:
+            day = parse_date(text(value))
+            if day is None:
+                raise ValueError(f"bad created_at: {value!r}")
+            moment = datetime.combine(day, day_time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def clean_row(row):
+    customer = text(row.get('customer_name'))
+    product = text(row.get('product_name'))
+    if not customer or not product:
+        raise ValueError("customer_name and product_name are required")
+    try:
+        quantity = Decimal(text(row.get('quantity')) or '1')
+    except InvalidOperation:
+        raise ValueError(f"bad quantity: {row.get('quantity')!r}")
+    if not quantity.is_finite() or quantity > MAX_QUANTITY:
+        raise ValueError(f"bad quantity: {row.get('quantity')!r}")
+    quantity = int(quantity)
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    status = text(row.get('order_status')).lower() or 'pending'
+    if status not in STATUSES:
+        raise ValueError(f"unknown order_status: {status!r}")
+    cleaned = {
+        'customer': (customer, text(row.get('customer_phone'))),
+        'customer_email': text(row.get('customer_email')) or None,
+        'customer_address': text(row.get('customer_address')) or None,
+        'product': (product, text(row.get('size'))),
+        'category': text(row.get('category')),
+        'quantity': quantity,
+        'order_status': status,
+        'created_at': parse_created_at(row.get('created_at')),
+    }
+    for column in MONEY_COLUMNS:
+        blank = column in ('sell_price', 'cost_price') and not text(row.get(column))
+        cleaned[column] = None if blank else money(row.get(column))
+    return cleaned
+
+
+def named(model, names):
+    # name -> id, creating the missing ones
+    names = {name for name in names if name}
+    found = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [model(name=name) for name in names - set(found)]
+    for obj in model.objects.bulk_create(missing):
+        found[obj.name] = obj.pk
+    return found
+
+
+def resolve_customers(rows, counts):
+    keys = {row['customer'] for row in rows}
+    found = {}
+    existing = Customer.objects.filter(name__in={name for name, _ in keys}).values_list('name', 'phone', 'id')
+    for name, phone, pk in existing.order_by('id'):
+        found.setdefault((name, phone or ''), pk)
+    details = {row['customer']: row for row in rows}
+    missing = [
+        Customer(name=name, phone=phone or None, email=details[(name, phone)]['customer_email'],
+                 address=details[(name, phone)]['customer_address'])
+        for name, phone in keys - set(found)
+    ]
+    created = Customer.objects.bulk_create(missing)
+    search.index_objects('customer', created)
+    for customer in created:
+        found[(customer.name, customer.phone or '')] = customer.pk
+    counts['customers'] = len(created)
+    return found
+
+
+def resolve_products(rows, counts):
+    sizes = named(Size, {size for _, size in (row['product'] for row in rows)})
+    found = {}
+    products = Product.objects.filter(name__in={row['product'][0] for row in rows}).select_related('size')
+    for product in products.order_by('id'):
+        found.setdefault((product.name, product.size.name if product.size else ''), product)
+
+    missing = {}
+    for row in rows:
+        key = row['product']
+        if key not in found and key not in missing:
+            missing[key] = row
+    if missing:
+        categories = named(Category, {row['category'] for row in missing.values()})
+        new_products = []
+        for (name, size), row in missing.items():
+            new_products.append(Product(
+                name=name,
+                size_id=sizes.get(size),
+                category_id=categories.get(row['category']),
+                display_name=f"{name} - {size}" if size else name,  # as Product.save() would
+                sell_price=row['sell_price'] or 0,
+                cost_price=row['cost_price'] or 0,
+            ))
+        created = Product.objects.bulk_create(new_products)
+        search.index_objects('product', created)
+        for key, product in zip(missing, created):
+            found[key] = product
+        counts['products'] = len(created)
+    return found
+
+
+def cents(values):
+    return np.array([int(value * 100) for value in values], dtype=np.int64)
+
+
+def compute_totals(rows, products):
+    # Order.save() arithmetic for the whole batch at once, in integer paise
+    quantity = np.array([row['quantity'] for row in rows], dtype=np.int64)
+    sell = cents(row['sell_price'] if row['sell_price'] is not None else products[row['product']].sell_price
+                 for row in rows)
+    cost = cents(row['cost_price'] if row['cost_price'] is not None else products[row['product']].cost_price
+                 for row in rows)
+    delivery = cents(row['delivery_cost'] for row in rows)
+    other = cents(row['other_expense'] for row in rows)
+    received = cents(row['received_amount'] for row in rows)
+
+    total = sell * quantity + delivery
+    pending = total - received
+    profit = (sell - cost) * quantity - other
+    payment_status = np.select([received <= 0, pending <= 0], ['pending', 'full_paid'], 'partial_paid')
+    return {
+        'unit_sell_price': sell, 'unit_cost_price': cost, 'total': total,
+        'pending_amount': pending, 'profit_amount': profit, 'payment_status': payment_status,
+    }
+
+
+def to_money(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+def import_batch(rows):
+    # Returns {'orders': n, 'customers': n, 'products': n} created
+    counts = {'orders': 0, 'customers': 0, 'products': 0}
+    customers = resolve_customers(rows, counts)
+    products = resolve_products(rows, counts)
+    totals = compute_totals(rows, products)
+
+    orders = []
+    for index, row in enumerate(rows):
+        product = products[row['product']]
+        orders.append(Order(
+            customer_id=customers[row['customer']],
+            product_id=product.pk,
+            quantity=row['quantity'],
+            unit_sell_price=to_money(totals['unit_sell_price'][index]),
+            unit_cost_price=to_money(totals['unit_cost_price'][index]),
+            delivery_cost=row['delivery_cost'],
+            other_expense=row['other_expense'],
+            total=to_money(totals['total'][index]),
+            received_amount=row['received_amount'],
+            pending_amount=to_money(totals['pending_amount'][index]),
+            profit_amount=to_money(totals['profit_amount'][index]),
+            order_status=row['order_status'],
+            payment_status=str(totals['payment_status'][index]),
+            created_at=row['created_at'],
+        ))
+    Order.objects.bulk_create(orders, batch_size=500)
+
+    # Received amounts become payments; the orders already carry their balance
+    Payment.objects.bulk_create(
+        [Payment(order=order, amount=order.received_amount, payment_date=order.created_at)
+         for order in orders if order.received_amount > 0],
+        batch_size=500,
+    )
+
+    # bulk_create skips the signals, so fold the batch into the rollup here
+    touched = rollups.apply_changes((None, rollups.order_contribution(order)) for order in orders)
+    report_cache.invalidate_days(key['day'] for key in touched)
+    counts['orders'] = len(orders)
+    return counts
+
+
+def import_orders(rows, batch_size=BATCH_SIZE):
+    result = ImportResult()
+    batch = []
+    first_line = 2
+
+    def save(rows):
+        with transaction.atomic():
+            counts = import_batch([row for _, row in rows])
+        result.created += counts['orders']
+        result.customers_created += counts['customers']
+        result.products_created += counts['products']
+
+    def flush():
+        if not batch:
+            return
+        try:
+            save(batch)
+        except DatabaseError:
+            # Again row by row, so the error names the bad line and the rest of the batch still goes in
+            for line, row in batch:
+                try:
+                    save([(line, row)])
+                except DatabaseError as exc:
+                    result.errors.append((line, f"database error: {exc}"))
+        batch.clear()
+
+    for line, row in enumerate(rows, start=first_line):
+        try:
+            batch.append((line, clean_row(row)))
+        except ValueError as exc:
+            result.errors.append((line, str(exc)))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    result.elapsed = time.perf_counter() - result.started
+    return result
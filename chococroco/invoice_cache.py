@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+from .invoices import invoice_data, render_invoice
+from .profiling import span
+
+SCAN_OVER = 100  # invalidations of more orders than this list the cache directory once instead
+
+
+def cache_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'invoice_cache')
+
+
+def fingerprint(order, data):
+    # Everything printed on the invoice, plus the order's last change
+    payload = dict(data, updated_at=order.updated_at.isoformat())
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def order_dir(order_id):
+    # One directory per order, so an order's copies are dropped without listing the whole cache
+    return os.path.join(cache_dir(), str(order_id))
+
+
+def cached_invoice(order):
+    # Returns (open file, fingerprint), rendering the PDF only when no copy exists yet. The file is opened
+    # here, so eviction or an invalidation running meanwhile cannot remove it before it is served.
+    data = invoice_data(order)
+    digest = fingerprint(order, data)
+    directory = order_dir(order.pk)
+    path = os.path.join(directory, f"{digest[:20]}.pdf")
+    try:
+        handle = open(path, 'rb')
+        os.utime(path)  # mark as recently used
+        return handle, digest
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    handle = os.fdopen(fd, 'w+b')
+    with span('pdf_render'):
+        handle.write(render_invoice(data))
+    handle.flush()
+    os.replace(tmp_path, path)
+    handle.seek(0)
+    invalidate([order.pk], keep=path)
+    evict(settings.INVOICE_CACHE_MAX_BYTES)
+    return handle, digest
+
+
+def _cached_files():
+    try:
+        entries = list(os.scandir(cache_dir()))
+    except FileNotFoundError:
+        return []
+    files = []
+    for entry in entries:
+        if entry.is_dir():
+            try:
+                files.extend(item for item in os.scandir(entry.path) if item.name.endswith('.pdf'))
+            except FileNotFoundError:
+                pass
+        elif entry.name.startswith('invoice_') and entry.name.endswith('.pdf'):
+            files.append(entry)  # from the old flat layout, never looked up again
+    return files
+
+
+def evict(max_bytes):
+    # Least recently used files go first
+    files = []
+    for entry in _cached_files():
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def invalidate(order_ids, keep=None):
+    order_ids = {str(pk) for pk in order_ids}
+    if len(order_ids) > SCAN_OVER:
+        # For big sets (renames, recomputes) one listing of the cached orders is cheaper than a lookup per id
+        try:
+            order_ids &= {entry.name for entry in os.scandir(cache_dir())}
+        except FileNotFoundError:
+            return
+    for order_id in order_ids:
+        try:
+            entries = list(os.scandir(order_dir(order_id)))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.path != keep and entry.name.endswith('.pdf'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,78 @@
+# ReportLab rendering, imported on first use through chococroco.invoices.renderer()
+import io
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+COMPANY_INFO = "<b>ChocoCroco Pvt Ltd</b><br/>123, Sweet Street<br/>Chennai, India<br/>Phone: +91-9876543210"
+FOOTER = "<b>Thanks for your order!</b><br/>Follow us on Instagram, Facebook, YouTube"
+
+# Built once per process and shared by every invoice rendered in it
+_styles = None
+_items_style = None
+
+
+def get_styles():
+    global _styles, _items_style
+    if _styles is None:
+        for font in ('Helvetica', 'Helvetica-Bold'):
+            pdfmetrics.getFont(font)  # load the font metrics now rather than during the first invoice
+        _styles = getSampleStyleSheet()
+        _items_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#f2f2f2")),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ])
+    return _styles, _items_style
+
+
+def invoice_elements(data):
+    styles, items_style = get_styles()
+    elements = []
+
+    # --- Header ---
+    company_info = Paragraph(COMPANY_INFO, styles['Normal'])
+    elements.append(Table([["Company Logo", company_info]], colWidths=[120, 380]))
+    elements.append(Spacer(1, 20))
+
+    # --- Customer + Order Info ---
+    customer_details = Paragraph(
+        f"<b>Customer:</b> {data['customer_name']}<br/>{data['customer_address']}",
+        styles['Normal']
+    )
+    order_details = Paragraph(
+        f"<b>Order No:</b> {data['id']}<br/><b>Date:</b> {data['date']}",
+        styles['Normal']
+    )
+    elements.append(Table([[customer_details, order_details]], colWidths=[250, 250]))
+    elements.append(Spacer(1, 20))
+
+    # --- Order Items Table ---
+    rows = [
+        ["Product", "Quantity", "Rate", "Total"],
+        [data['product'], data['quantity'], f"₹{data['rate']}", f"₹{data['product_total']}"],
+        ["", "", "Subtotal", f"₹{data['product_total']}"],
+        ["", "", "Delivery Cost", f"₹{data['delivery_cost']}"],
+        ["", "", "Other Expense", f"₹{data['other_expense']}"],
+        ["", "", "Grand Total", f"₹{data['total']}"],
+        ["", "", "Profit", f"₹{data['profit_amount']}"],
+    ]
+    table = Table(rows, colWidths=[200, 80, 100, 100])
+    table.setStyle(items_style)
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+
+    # --- Footer ---
+    elements.append(Paragraph(FOOTER, styles['Normal']))
+    return elements
+
+
+def render_invoice(data):
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(invoice_elements(data))
+    return buffer.getvalue()
+
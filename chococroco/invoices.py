@@ -0,0 +1,134 @@
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .pdf_merge import merge
+
+logger = logging.getLogger(__name__)
+
+
+def invoice_data(order):
+    # Plain values only, so the data can be pickled to a worker process
+    product = order.product
+    return {
+        'id': order.id,
+        'date': order.created_at.strftime('%d-%m-%Y'),
+        'customer_name': order.customer.name,
+        'customer_address': order.customer.address,
+        'product': product.display_name if product.display_name else product.name,
+        'quantity': order.quantity,
+        'rate': str(order.unit_sell_price),
+        'product_total': str(order.product_total()),
+        'delivery_cost': str(order.delivery_cost),
+        'other_expense': str(order.other_expense),
+        'total': str(order.total),
+        'profit_amount': str(order.profit_amount),
+    }
+
+
+def iter_invoice_data(orders, chunk_size=500):
+    for order in orders.select_related('customer', 'product').iterator(chunk_size=chunk_size):
+        yield invoice_data(order)
+
+
+def renderer():
+    # ReportLab is only imported by the code paths that actually produce a PDF
+    from . import invoice_pdf
+    return invoice_pdf
+
+
+def init_renderer():
+    renderer().get_styles()
+
+
+def render_invoice(data):
+    return renderer().render_invoice(data)
+
+
+class BatchStats:
+    def __init__(self):
+        self.count = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self):
+        self.count += 1
+        self.stop()
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return f"{self.count} invoices in {self.elapsed:.2f}s ({self.rate:.1f} invoices/sec)"
+
+
+def _render_with_id(data):
+    return data['id'], render_invoice(data)
+
+
+def render_many(data_iter, workers=None, stats=None):
+    # Yields (order_id, pdf_bytes) in input order with a bounded number of invoices in flight
+    stats = stats or BatchStats()
+    workers = workers or os.cpu_count() or 1
+    in_flight = workers * 4
+    # Workers come from a fork server, not a fork of this process: the web server and run_jobs are threaded,
+    # and a child forked while another thread holds a lock would wait on it forever
+    context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_renderer, mp_context=context) as pool:
+        pending = deque()
+        for data in data_iter:
+            pending.append(pool.submit(_render_with_id, data))
+            if len(pending) >= in_flight:
+                stats.add()
+                yield pending.popleft().result()
+        while pending:
+            stats.add()
+            yield pending.popleft().result()
+    logger.info("Rendered %s", stats)
+
+
+class _ZipChunks:
+    # Write-only sink for ZipFile; the chunks are drained after each member
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files):
+    # files yields (name, bytes); yields the archive piece by piece
+    sink = _ZipChunks()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def render_merged(data_iter, output, workers=None, stats=None):
+    # One document, one invoice per page: rendered by the pool and appended to output as each invoice arrives
+    for chunk in merge(pdf for _, pdf in render_many(data_iter, workers=workers, stats=stats)):
+        output.write(chunk)
+
+
+def invoice_files(pdfs):
+    for order_id, pdf in pdfs:
+        yield f"invoice_{order_id}.pdf", pdf
@@ -0,0 +1,275 @@
+import logging
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.db.models import F
+from django.http import HttpRequest, HttpResponseRedirect, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+
+from . import report_cache
+from .dispatch import iter_slip_data, write_dispatch_pack
+from .exports import model_rows, model_sheets, profit_loss_rows, report_sheets, write_csv, write_xlsx
+from .invoices import invoice_files, iter_invoice_data, render_many, render_merged, stream_zip
+from .models import Job, Order
+from .reports import filter_orders, report_db
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = 'jobs'
+UPLOAD_DIR = f'{JOB_DIR}/uploads'  # files a queued job reads, removed once it has run
+MAX_ATTEMPTS = 3  # runs cut short by a dead worker before the job is failed instead of queued again
+
+JOBS = {}  # kind -> (function, title)
+
+
+def register(kind, title):
+    # function(output, progress, **params) writes the file to the binary output and returns its download name
+    def decorator(function):
+        JOBS[kind] = (function, title)
+        return function
+    return decorator
+
+
+def title(kind):
+    return JOBS[kind][1] if kind in JOBS else kind
+
+
+def inline(count):
+    # Whether a selection this size is still answered in the request
+    limit = settings.JOBS_INLINE_MAX_ROWS
+    return limit is None or count <= limit
+
+
+def dump_selection(request, queryset):
+    # An admin action's selection as plain JSON: "select all" keeps the changelist's query string, which the
+    # worker re-applies through the ModelAdmin (no id list, however many rows match); otherwise the checked ids,
+    # at most a changelist page
+    selection = {'model': queryset.model._meta.label_lower, 'user': request.user.pk}
+    if request.POST.get('select_across') == '1':
+        selection['changelist'] = request.GET.urlencode()
+    else:
+        selection['ids'] = list(queryset.values_list('pk', flat=True))
+    return selection
+
+
+def load_selection(selection):
+    model = apps.get_model(selection['model'])
+    if 'ids' in selection:
+        return model.objects.filter(pk__in=selection['ids'])
+    # The changelist as the user who queued the job saw it: their filters, search and ordering
+    request = HttpRequest()
+    request.GET = QueryDict(selection['changelist'])
+    request.user = get_user_model().objects.get(pk=selection['user'])
+    model_admin = admin.site.get_model_admin(model)
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+def enqueue(request, kind, total=0, **params):
+    if kind not in JOBS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    # Jobs take a worker and disk space, so only staff may queue them
+    if not request.user.is_staff:
+        raise PermissionDenied("Only staff can queue background jobs.")
+    return Job.objects.create(kind=kind, params=params, total=total, created_by=request.user)
+
+
+def start(request, kind, total=0, **params):
+    # Queues the job and sends the browser to its progress page
+    job = enqueue(request, kind, total, **params)
+    return HttpResponseRedirect(reverse('job_progress', args=[job.pk]))
+
+
+def start_for_queryset(request, kind, queryset, total, **params):
+    return start(request, kind, total, selection=dump_selection(request, queryset), **params)
+
+
+def save_upload(upload):
+    # Keeps an uploaded file for the worker; returns its path under MEDIA_ROOT
+    extension = upload.name.rsplit('.', 1)[-1].lower()
+    name = f"{UPLOAD_DIR}/{uuid.uuid4().hex}/upload.{extension}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as output:
+        for chunk in upload.chunks():
+            output.write(chunk)
+    return name
+
+
+def visible(request, job):
+    user = request.user
+    return user.is_superuser or (user.is_authenticated and job.created_by_id == user.pk)
+
+
+class Progress:
+    # Counts the items a job has been through. The worker's main thread writes the count to the job row
+    # (save_progress), since the job's own connection may be mid-read; SQLite refuses a write from a
+    # connection whose read snapshot is older than another thread's commit.
+    def __init__(self, job):
+        self.job = job
+        self.done = 0
+        self.saved = 0
+        self.message = ''  # shown with the download once the job is done
+
+    def track(self, items):
+        for item in items:
+            yield item
+            self.done += 1
+
+
+def save_progress(progress):
+    done = progress.done
+    if done != progress.saved:
+        Job.objects.filter(pk=progress.job.pk, status='running').update(progress=done)
+        progress.saved = done
+
+
+def tracked(sheets, progress):
+    return [(name, progress.track(rows)) for name, rows in sheets]
+
+
+def claim(worker):
+    # Oldest queued job, taken with a conditional update so two workers never start the same one
+    while True:
+        pk = Job.objects.filter(status='queued').order_by('created_at', 'id').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status='queued').update(
+            status='running', worker=worker, progress=0, started_at=now, heartbeat_at=now,
+            attempts=F('attempts') + 1)
+        if claimed:
+            return Job.objects.get(pk=pk)
+
+
+def finish(job, status, progress, **fields):
+    # Only if this worker still owns the job (it may have been queued again as stale)
+    return Job.objects.filter(pk=job.pk, status='running', worker=job.worker).update(
+        status=status, progress=progress, finished_at=timezone.now(), **fields)
+
+
+def run(job, progress):
+    # Writes the file to MEDIA_ROOT/jobs/<random>/<name>; returns whether the job succeeded
+    directory = f"{JOB_DIR}/{uuid.uuid4().hex}"  # unguessable, since MEDIA_URL may serve the file too
+    path = os.path.join(settings.MEDIA_ROOT, directory)
+    try:
+        function, _ = JOBS[job.kind]
+        os.makedirs(path)
+        partial = os.path.join(path, 'partial')
+        with open(partial, 'wb') as output:
+            filename = function(output, progress, **job.params)
+        os.replace(partial, os.path.join(path, filename))
+        status, fields = 'done', {'artifact': f"{directory}/{filename}", 'message': progress.message}
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", job.pk, job.kind)
+        status, fields = 'failed', {'message': f"{type(exc).__name__}: {exc}"}
+    # A fresh connection for the final write, as a failed job's may still be holding a read open
+    connections.close_all()
+    try:
+        if not finish(job, status, progress.done, **fields):
+            status = 'lost'
+    finally:
+        connections.close_all()
+    if status != 'done':
+        shutil.rmtree(path, ignore_errors=True)
+    return status == 'done'
+
+
+def heartbeat(worker):
+    return Job.objects.filter(status='running', worker=worker).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale():
+    # Running jobs whose worker stopped sending heartbeats (killed or crashed) go back to the queue
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_STALE_AFTER)
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failed', finished_at=timezone.now(), message="The worker running this job stopped responding.")
+    return stale.update(status='queued', worker=''), failed
+
+
+def artifact_path(job):
+    return os.path.join(settings.MEDIA_ROOT, job.artifact)
+
+
+def purge():
+    # Finished jobs older than JOBS_KEEP_DAYS, with their files
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_KEEP_DAYS)
+    old = Job.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff)
+    for artifact in old.exclude(artifact='').values_list('artifact', flat=True):
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, os.path.dirname(artifact)), ignore_errors=True)
+    return old.delete()[0]
+
+
+@register('model_csv', "CSV export")
+def model_csv(output, progress, selection, select_related=None):
+    queryset = load_selection(selection)
+    write_csv(progress.track(model_rows(queryset, select_related)), output)
+    return f'{queryset.model._meta}.csv'
+
+
+@register('model_xlsx', "Excel export")
+def model_xlsx(output, progress, selection, select_related=None):
+    queryset = load_selection(selection)
+    write_xlsx(tracked(model_sheets(queryset, select_related), progress), output)
+    return f'{queryset.model._meta}.xlsx'
+
+
+@register('profit_loss_csv', "Profit/Loss export")
+def profit_loss_csv(output, progress, selection):
+    write_csv(progress.track(profit_loss_rows(load_selection(selection))), output)
+    return 'profit_loss.csv'
+
+
+@register('invoices_zip', "Invoices (ZIP)")
+def invoices_zip(output, progress, selection):
+    pdfs = render_many(iter_invoice_data(load_selection(selection)), workers=settings.INVOICE_WORKERS)
+    for chunk in stream_zip(invoice_files(progress.track(pdfs))):
+        output.write(chunk)
+    return 'invoices.zip'
+
+
+@register('invoices_pdf', "Invoices (single PDF)")
+def invoices_pdf(output, progress, selection):
+    data = progress.track(iter_invoice_data(load_selection(selection)))
+    render_merged(data, output, workers=settings.INVOICE_WORKERS)
+    return 'invoices.pdf'
+
+
+@register('dispatch_pack', "Delivery labels + manifest")
+def dispatch_pack(output, progress, selection):
+    write_dispatch_pack(progress.track(iter_slip_data(load_selection(selection))), output)
+    return 'dispatch.zip'
+
+
+@register('import_orders', "Order import")
+def import_orders(output, progress, upload, file_format):
+    from . import importer  # numpy is only needed here
+    path = os.path.join(settings.MEDIA_ROOT, upload)
+    try:
+        # Batches already imported by a run that was cut short would be imported twice
+        if progress.job.attempts > 1:
+            raise RuntimeError("The import was interrupted; check the orders before uploading the file again.")
+        with open(path, 'rb') as handle:
+            result = importer.import_orders(progress.track(importer.read_rows(handle, file_format)))
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    progress.message = str(result)
+    write_csv([('row', 'error'), *result.errors], output)
+    return 'rejected_rows.csv'
+
+
+@register('order_report_xlsx', "Order report (Excel)")
+def order_report_xlsx(output, progress, start_date=None, end_date=None, status=None):
+    filters = report_cache.normalize(start_date, end_date, status)
+    orders = filter_orders(Order.objects.using(report_db()), *filters)
+    write_xlsx(tracked(report_sheets(orders, report_cache.params(filters)), progress), output)
+    return 'order_report.xlsx'
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now, Round
+from django.db.models.lookups import LessThanOrEqual
+
+from . import report_cache
+from .models import Order, Payment
+from .reports import MONEY
+
+BATCH_SIZE = 1000
+
+
+def payment_status(received, pending, keep_refunded=True):
+    # Status for the balance the same UPDATE is writing; refunds are left alone unless being cleared
+    refunded = [When(payment_status='refunded', then=Value('refunded'))] if keep_refunded else []
+    return Case(
+        *refunded,
+        When(LessThanOrEqual(received, Value(0, output_field=MONEY)), then=Value('pending')),
+        When(LessThanOrEqual(pending, Value(0, output_field=MONEY)), then=Value('full_paid')),
+        default=Value('partial_paid'),
+        output_field=CharField(),
+    )
+
+
+def balance_fields(received=None, total=None):
+    # pending_amount and payment_status for the received amount and total an UPDATE leaves in the row (the
+    # stored ones by default). Rounded to the stored two places, since SQLite does this arithmetic in
+    # floating point and the status compares the results.
+    received = F('received_amount') if received is None else received
+    total = F('total') if total is None else total
+    pending = Round(total - received, 2)
+    return {'pending_amount': pending, 'payment_status': payment_status(received, pending)}
+
+
+def status_for(received, pending, current):
+    # payment_status() for an order that isn't stored yet
+    if current == 'refunded':
+        return current
+    if received <= 0:
+        return 'pending'
+    return 'full_paid' if pending <= 0 else 'partial_paid'
+
+
+def mark_refunded(orders):
+    # The one status set by hand; payments keep moving the amounts, but not the status, until cleared
+    report_cache.invalidate_orders(orders)
+    return orders.update(payment_status='refunded', updated_at=Now())
+
+
+def clear_refund(orders):
+    # Back to the status the balance gives
+    orders = orders.filter(payment_status='refunded')
+    report_cache.invalidate_orders(orders)
+    return orders.update(payment_status=payment_status(F('received_amount'), F('pending_amount'), keep_refunded=False),
+                         updated_at=Now())
+
+
+def apply_payment(order_id, amount):
+    # Single UPDATE so concurrent payments on the same order never lose an increment; updated_at moves too, as
+    # API clients poll ?updated_at__gte= for changed orders
+    if not amount:
+        return
+    received = Round(F('received_amount') + Value(Decimal(amount), output_field=MONEY), 2)
+    Order.objects.filter(pk=order_id).update(received_amount=received, updated_at=Now(), **balance_fields(received))
+
+
+def payment_changed(old, new):
+    # old/new are (order_id, amount) pairs or None
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None:
+            apply_payment(old[0], -old[1])
+        if new is not None:
+            apply_payment(new[0], new[1])
+
+
+def import_payments(payments, batch_size=BATCH_SIZE):
+    # bulk_create skips the signals, so each order gets its summed amount in one update
+    payments = list(payments)
+    totals = defaultdict(Decimal)
+    for payment in payments:
+        totals[payment.order_id] += Decimal(payment.amount)
+    with transaction.atomic():
+        Payment.objects.bulk_create(payments, batch_size=batch_size)
+        for order_id, amount in totals.items():
+            apply_payment(order_id, amount)
+        report_cache.invalidate_orders(Order.objects.filter(pk__in=totals))
+    return len(payments), len(totals)
+
+
+def payments_received():
+    return Coalesce(
+        Subquery(Payment.objects.filter(order=OuterRef('pk')).order_by()
+                 .values('order').annotate(sum=Sum('amount')).values('sum')[:1]),
+        Value(0, output_field=MONEY),
+        output_field=MONEY,
+    )
+
+
+def resync(orders):
+    # Rebuild received/pending/status from the payments table in one statement
+    received = Round(payments_received(), 2)
+    report_cache.invalidate_orders(orders)
+    return orders.update(received_amount=received, updated_at=Now(), **balance_fields(received))
+
+
+def out_of_sync(orders):
+    return orders.annotate(paid=Round(payments_received(), 2)).exclude(received_amount=F('paid'))
@@ -0,0 +1,132 @@
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chococroco import analytics
+from chococroco.models import Order, Product
+
+
+def synthetic_chunks(count, chunk_size, products=200, customers=50000, seed=0):
+    # values_list()-shaped tuples with Decimal money and aware datetimes, like the database returns
+    rng = np.random.default_rng(seed)
+    start = timezone.make_aware(datetime(2024, 1, 1))
+    category_of = rng.integers(1, 12, products + 1)
+    for offset in range(0, count, chunk_size):
+        size = min(chunk_size, count - offset)
+        seconds = rng.integers(0, 365 * 24 * 3600, size)
+        customer = rng.integers(1, customers, size)
+        product = rng.integers(1, products + 1, size)
+        quantity = rng.integers(1, 10, size)
+        sell = rng.integers(1000, 50000, size)
+        cost = (sell * rng.uniform(0.4, 0.9, size)).astype(np.int64)
+        delivery = rng.integers(0, 10000, size)
+        other = rng.integers(0, 2000, size)
+        rows = [
+            (start + timedelta(seconds=int(s)), int(c), int(p), int(q), Decimal(int(sp)).scaleb(-2),
+             Decimal(int(cp)).scaleb(-2), Decimal(int(d)).scaleb(-2), Decimal(int(o)).scaleb(-2))
+            for s, c, p, q, sp, cp, d, o in zip(seconds, customer, product, quantity, sell, cost, delivery, other)
+        ]
+        yield rows, category_of
+
+
+def per_instance(orders, category_of):
+    # What the reports did before: one model instance per order and its profit()/cost_total() methods
+    periods = defaultdict(lambda: {'revenue': Decimal(0), 'cost': Decimal(0), 'profit': Decimal(0), 'orders': 0})
+    customers = defaultdict(Counter)
+    products = defaultdict(Counter)
+    categories = defaultdict(Counter)
+    for order in orders:
+        key = timezone.localtime(order.created_at).strftime('%Y-%m')
+        revenue = order.order_total()
+        figures = periods[key]
+        figures['revenue'] += revenue
+        figures['cost'] += order.cost_total()
+        figures['profit'] += order.profit()
+        figures['orders'] += 1
+        customers[key][order.customer_id] += 1
+        products[key][order.product_id] += revenue
+        categories[key][category_of(order)] += revenue
+    for key, figures in periods.items():
+        figures['repeat_customers'] = sum(1 for n in customers[key].values() if n > 1)
+        figures['top_products'] = products[key].most_common(analytics.TOP_N)
+        figures['top_categories'] = categories[key].most_common(analytics.TOP_N)
+    return periods
+
+
+class Command(BaseCommand):
+    help = ("Compare the pandas analytics against looping over Order instances. Uses generated in-memory rows "
+            "by default (nothing is written to the database), or the real orders with --database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--chunk-size', type=int, default=analytics.CHUNK_SIZE)
+        parser.add_argument('--database', action='store_true', help="Benchmark the orders in the database.")
+
+    def handle(self, *args, **options):
+        if options['database']:
+            loop_time, vector_time, loop_totals, vector_totals, count = self.from_database()
+        else:
+            loop_time, vector_time, loop_totals, vector_totals, count = self.synthetic(options['orders'],
+                                                                                        options['chunk_size'])
+        self.stdout.write(f"{count} orders")
+        self.stdout.write(f"Per-instance methods: {loop_time:.2f}s")
+        self.stdout.write(f"Vectorised (pandas):  {vector_time:.2f}s")
+        if vector_time:
+            self.stdout.write(f"Speed-up: {loop_time / vector_time:.1f}x")
+        if loop_totals == vector_totals:
+            self.stdout.write(self.style.SUCCESS(f"Totals match: {vector_totals}"))
+        else:
+            self.stderr.write(f"Totals differ: loop {loop_totals}, vectorised {vector_totals}")
+
+    def synthetic(self, count, chunk_size):
+        loop_time = vector_time = 0.0
+        loop_totals = Counter()
+        chunks = []
+        category_of = None
+        for rows, category_of in synthetic_chunks(count, chunk_size):
+            # Both sides start from the same tuples; only the processing is timed
+            started = time.perf_counter()
+            orders = (Order(created_at=r[0], customer_id=r[1], product_id=r[2], quantity=r[3], unit_sell_price=r[4],
+                            unit_cost_price=r[5], delivery_cost=r[6], other_expense=r[7]) for r in rows)
+            periods = per_instance(orders, lambda order: int(category_of[order.product_id]))
+            loop_time += time.perf_counter() - started
+            for figures in periods.values():
+                loop_totals.update({key: figures[key] for key in ('revenue', 'cost', 'profit', 'orders')})
+
+            started = time.perf_counter()
+            chunks.append(analytics.typed_chunk(rows))
+            vector_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        df = analytics.combine(chunks)
+        df['category_id'] = category_of[df['product_id'].to_numpy()]
+        data = analytics.summary(df, 'month')
+        vector_time += time.perf_counter() - started
+        return loop_time, vector_time, self.loop_totals(loop_totals), self.vector_totals(data), count
+
+    def from_database(self):
+        orders = Order.objects.all()
+        categories = dict(Product.objects.values_list('pk', 'category_id'))
+
+        started = time.perf_counter()
+        periods = per_instance(orders.iterator(), lambda order: categories.get(order.product_id))
+        loop_time = time.perf_counter() - started
+        loop_totals = Counter()
+        for figures in periods.values():
+            loop_totals.update({key: figures[key] for key in ('revenue', 'cost', 'profit', 'orders')})
+
+        started = time.perf_counter()
+        data = analytics.summary(analytics.order_frame(orders), 'month')
+        vector_time = time.perf_counter() - started
+        return loop_time, vector_time, self.loop_totals(loop_totals), self.vector_totals(data), data['totals']['orders']
+
+    def loop_totals(self, totals):
+        return {key: totals.get(key, 0) for key in ('revenue', 'cost', 'profit', 'orders')}
+
+    def vector_totals(self, data):
+        return {key: data['totals'][key] for key in ('revenue', 'cost', 'profit', 'orders')}
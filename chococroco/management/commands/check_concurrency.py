@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from chococroco import ledger
+from chococroco.models import Customer, Order, Payment, Product
+
+
+def add_payments(threads, payments, orders):
+    # Returns the insert errors and the seconds taken; also run by the test suite (chococroco/tests.py)
+    customer = Customer.objects.create(name="Concurrency check")
+    product = Product.objects.create(name="Concurrency check", sell_price=Decimal('100.00'))
+    order_ids = [Order.objects.create(customer=customer, product=product, quantity=100).pk
+                 for _ in range(max(1, orders))]
+    connection.close()  # the threads open their own connections
+    start = threading.Barrier(threads)
+
+    def worker(index):
+        failures = []
+        try:
+            start.wait()
+            for number in range(payments):
+                order_id = order_ids[(index + number) % len(order_ids)]
+                try:
+                    with transaction.atomic():
+                        order = Order.objects.get(pk=order_id)
+                        Payment.objects.create(order=order, amount=Decimal('1.00'))
+                except OperationalError as exc:
+                    failures.append(str(exc))
+        finally:
+            connections.close_all()
+        return failures
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    return [message for failures in results for message in failures], time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ("Add payments from several threads at once, the way concurrent admin saves do (read the order, then "
+            "write the payment inside one transaction), against a throwaway database built with the configured "
+            "profile. Fails if any insert errors (e.g. \"database is locked\") or the order balances do not add up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--payments', type=int, default=25, help="Payments added by each thread.")
+        parser.add_argument('--orders', type=int, default=3, help="Orders the payments are spread over.")
+        parser.add_argument('--without-tuning', action='store_true',
+                            help="Drop the SQLite OPTIONS (WAL, busy_timeout, IMMEDIATE) to compare with the defaults.")
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        saved = (settings_dict['TEST'].get('NAME'), settings_dict.get('OPTIONS', {}))
+        tempdir = None
+        if connection.vendor == 'sqlite':
+            # A file, not the shared in-memory test database, so locking behaves as it does in production
+            tempdir = tempfile.mkdtemp(prefix='chococroco-concurrency-')
+            settings_dict['TEST']['NAME'] = os.path.join(tempdir, 'concurrency.sqlite3')
+            if options['without_tuning']:
+                settings_dict['OPTIONS'] = {}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            failures, elapsed = add_payments(options['threads'], options['payments'], options['orders'])
+            expected = options['threads'] * options['payments'] - len(failures)
+            stored = Payment.objects.count()
+            out_of_sync = ledger.out_of_sync(Order.objects.all()).count()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings_dict['TEST']['NAME'], settings_dict['OPTIONS'] = saved
+            if tempdir:
+                shutil.rmtree(tempdir, ignore_errors=True)
+
+        total = options['threads'] * options['payments']
+        self.stdout.write(f"{connection.vendor}: {total} payments from {options['threads']} threads in "
+                          f"{elapsed:.2f}s, {len(failures)} failed, {stored} stored, "
+                          f"{out_of_sync} orders out of sync with their payments")
+        for message in sorted(set(failures))[:5]:
+            self.stderr.write(f"  {message}")
+        if failures or stored != expected or out_of_sync:
+            raise CommandError("Concurrent payment inserts failed or lost updates.")
+        self.stdout.write(self.style.SUCCESS("No concurrent insert failed."))
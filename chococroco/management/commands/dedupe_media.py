@@ -0,0 +1,87 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chococroco import report_cache
+from chococroco.storage import CHUNK_SIZE, content_name, file_digest, image_models, recount
+from chococroco.thumbnails import missing_targets, render_all
+
+
+def read_chunks(path):
+    with open(path, 'rb') as handle:
+        while True:
+            chunk = handle.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class Command(BaseCommand):
+    help = ("Move order/product images to content-addressed names, point the rows at them "
+            "and remove the duplicate originals.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--extra-root', action='append', default=[],
+                            help="Another directory to look for files the rows refer to "
+                                 "(e.g. a stray top-level order_images/ parent). Repeatable.")
+        parser.add_argument('--keep-originals', action='store_true', help="Do not delete the original files.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would change.")
+
+    def find_source(self, name, roots):
+        for root in roots:
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def handle(self, *args, **options):
+        roots = [settings.MEDIA_ROOT] + options['extra_root']
+        names = set()
+        for model in image_models():
+            names.update(model.objects.exclude(image='').exclude(image__isnull=True)
+                         .values_list('image', flat=True).distinct().iterator())
+
+        moved = {}
+        unique = {}
+        saved = 0
+        for name in sorted(names):
+            source = self.find_source(name, roots)
+            if source is None:
+                self.stderr.write(f"Missing file for {name}")
+                continue
+            target = content_name(file_digest(read_chunks(source)), os.path.splitext(name)[1])
+            if target == name:
+                continue
+            size = os.path.getsize(source)
+            if target in unique:
+                saved += size
+            unique[target] = size
+            moved[name] = (source, target)
+
+        self.stdout.write(f"{len(names)} referenced files, {len(moved)} to rename, "
+                          f"{saved} bytes of duplicates.")
+        if options['dry_run']:
+            return
+
+        for name, (source, target) in moved.items():
+            destination = os.path.join(settings.MEDIA_ROOT, target)
+            if not os.path.exists(destination):
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(source, destination + '.tmp')
+                os.replace(destination + '.tmp', destination)
+            with transaction.atomic():
+                for model in image_models():
+                    model.objects.filter(image=name).update(image=target)
+            render_all(destination, missing_targets(target))
+
+        recount()
+        report_cache.invalidate_all()
+
+        if not options['keep_originals']:
+            for name, (source, target) in moved.items():
+                if os.path.abspath(source) != os.path.abspath(os.path.join(settings.MEDIA_ROOT, target)):
+                    os.remove(source)
+        self.stdout.write(self.style.SUCCESS(f"Repointed {len(moved)} files onto {len(unique)} unique images."))
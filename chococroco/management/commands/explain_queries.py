@@ -0,0 +1,77 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from django.contrib import admin
+
+from chococroco import rollups
+from chococroco.models import Customer, DailySales, Order, Product
+from chococroco.reports import ORDER_COST, filter_orders, page_queryset
+
+CHECKED_TABLES = (Order._meta.db_table, DailySales._meta.db_table, Customer._meta.db_table, Product._meta.db_table)
+
+
+def full_scans(plan, vendor):
+    tables = '|'.join(CHECKED_TABLES)
+    if vendor == 'sqlite':
+        # "SCAN t" reads every row, also "SCAN t USING INDEX" (a walk of the whole index); only SEARCH seeks
+        pattern = rf'\bSCAN ({tables})\b'
+    elif vendor == 'postgresql':
+        pattern = rf'Seq Scan on ({tables})\b'
+    else:
+        pattern = rf'\bALL\b.*\b({tables})\b'
+    return re.findall(pattern, plan)
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN on the report, changelist, export and autocomplete queries and fail if any does a full table scan."
+
+    def report_queries(self):
+        today = timezone.localdate()
+        start, end = today - timedelta(days=30), today
+        orders = Order.objects.all()
+        ordering = admin.site._registry[Order].get_ordering(None)
+        ids = list(orders.order_by('-id').values_list('id', flat=True)[:100]) or [0]
+        return {
+            'report rows (date range)': page_queryset(filter_orders(orders, start, end)),
+            'report rows (date range + status)': page_queryset(filter_orders(orders, start, end, 'pending')),
+            'report rows (next page)': page_queryset(filter_orders(orders, start, end),
+                                                     cursor=f"{timezone.now().isoformat()}_{ids[0]}"),
+            'report totals (rollup)': rollups.filter_rollup(DailySales.objects.all(), start, end, 'pending')
+                .values('order_status'),
+            'report totals (raw orders)': filter_orders(orders, start, end).annotate(cost=ORDER_COST)
+                .values('cost'),
+            'changelist: order_status filter': orders.filter(order_status='pending').order_by(*ordering)[:100],
+            'changelist: payment_status filter': orders.filter(payment_status='pending')
+                .order_by(*ordering)[:100],
+            'changelist: created_at filter': orders.filter(created_at__gte=timezone.now() - timedelta(days=7))
+                .order_by(*ordering)[:100],
+            'changelist: category filter': orders.filter(product__category=1).order_by(*ordering)[:100],
+            'export: selected orders': orders.filter(pk__in=ids).select_related('customer', 'product'),
+            'api: updated_at polling': orders.filter(updated_at__gte=timezone.now() - timedelta(hours=1))
+                .order_by('updated_at', 'id')[:100],
+            'autocomplete: customer prefix': self.autocomplete_prefix(Customer, 'Ann'),
+            'autocomplete: product prefix': self.autocomplete_prefix(Product, 'Cho'),
+        }
+
+    def autocomplete_prefix(self, model, term):
+        model_admin = admin.site._registry[model]
+        queryset = model_admin.get_queryset(None).filter(model_admin.prefix_q(term))
+        return queryset.values_list('pk', flat=True)[:model_admin.autocomplete_limit]
+
+    def handle(self, *args, **options):
+        failures = []
+        for label, queryset in self.report_queries().items():
+            plan = queryset.explain()
+            scans = full_scans(plan, connection.vendor)
+            status = self.style.ERROR('FULL SCAN') if scans else self.style.SUCCESS('ok')
+            self.stdout.write(f"{label}: {status}")
+            if options['verbosity'] > 1 or scans:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+            if scans:
+                failures.append(label)
+        if failures:
+            raise CommandError(f"Full table scans in: {', '.join(failures)}")
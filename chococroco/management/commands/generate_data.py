@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco.sampledata import BATCH_SIZE, generate
+
+
+class Command(BaseCommand):
+    help = ("Add realistic sample data (customers, categorised and sized products, orders with payments and images) "
+            "using bulk inserts. Meant for development and benchmark databases.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--images', type=int, default=10, help="Distinct images shared by products and orders.")
+        parser.add_argument('--days', type=int, default=365, help="Spread order dates over this many past days.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            counts = generate(customers=options['customers'], products=options['products'], orders=options['orders'],
+                              images=options['images'], days=options['days'], seed=options['seed'],
+                              batch_size=options['batch_size'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            "Added {customers} customers, {products} products, {orders} orders, {images} images.".format(**counts)))
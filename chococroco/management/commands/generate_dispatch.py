@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco.dispatch import iter_slip_data, write_dispatch_pack
+from chococroco.models import Order
+from chococroco.reports import filter_orders
+
+
+class Command(BaseCommand):
+    help = ("Write a dispatch pack (ZIP with PDF label sheets of up to 1000 labels, several per A4 page, and a CSV "
+            "manifest) for a filtered set of orders, e.g. all pending orders of a day.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the .zip file to write.")
+        parser.add_argument('--date', help="Orders created on this date (YYYY-MM-DD).")
+        parser.add_argument('--start-date', help="Orders created on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--end-date', help="Orders created on or before this date (YYYY-MM-DD).")
+        parser.add_argument('--status', choices=[choice for choice, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--ids', nargs='+', type=int, help="Only these order ids.")
+
+    def handle(self, *args, **options):
+        if options['date'] and (options['start_date'] or options['end_date']):
+            raise CommandError("Use either --date or --start-date/--end-date.")
+        start = options['date'] or options['start_date']
+        end = options['date'] or options['end_date']
+        orders = filter_orders(Order.objects.all(), start, end, options['status'])
+        if options['ids']:
+            orders = orders.filter(pk__in=options['ids'])
+
+        started = time.perf_counter()
+        with open(options['output'], 'wb') as output:
+            count = write_dispatch_pack(iter_slip_data(orders), output)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}: {count} labels in {elapsed:.2f}s"))
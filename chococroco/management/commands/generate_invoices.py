@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco.invoices import BatchStats, invoice_files, iter_invoice_data, render_many, render_merged, stream_zip
+from chococroco.models import Order
+from chococroco.reports import filter_orders
+
+
+class Command(BaseCommand):
+    help = "Render invoices for many orders into a ZIP of PDFs or a single merged PDF."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the .zip or .pdf file to write.")
+        parser.add_argument('--ids', nargs='+', type=int, help="Only these order ids.")
+        parser.add_argument('--start-date', help="Orders created on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--end-date', help="Orders created on or before this date (YYYY-MM-DD).")
+        parser.add_argument('--status', choices=[choice for choice, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--format', choices=['zip', 'pdf'], help="Defaults to the output file extension.")
+        parser.add_argument('--workers', type=int, default=settings.INVOICE_WORKERS,
+                            help="Worker processes rendering the invoices (default: one per CPU).")
+
+    def handle(self, *args, **options):
+        output_format = options['format'] or options['output'].rsplit('.', 1)[-1].lower()
+        if output_format not in ('zip', 'pdf'):
+            raise CommandError("Use a .zip or .pdf output file, or pass --format.")
+
+        orders = filter_orders(Order.objects.all(), options['start_date'], options['end_date'], options['status'])
+        if options['ids']:
+            orders = orders.filter(pk__in=options['ids'])
+        orders = orders.order_by('id')
+
+        stats = BatchStats()
+        with open(options['output'], 'wb') as output:
+            if output_format == 'zip':
+                pdfs = render_many(iter_invoice_data(orders), workers=options['workers'], stats=stats)
+                for chunk in stream_zip(invoice_files(pdfs)):
+                    output.write(chunk)
+            else:
+                render_merged(iter_invoice_data(orders), output, workers=options['workers'], stats=stats)
+        stats.stop()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}: {stats}"))
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chococroco.models import Order, Product
+from chococroco.thumbnails import missing_targets, render_all
+
+
+class Command(BaseCommand):
+    help = "Generate missing thumbnails for every order and product image using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+
+    def image_names(self):
+        names = set()
+        for model in (Order, Product):
+            names.update(model.objects.exclude(image='').exclude(image__isnull=True)
+                         .values_list('image', flat=True).distinct().iterator())
+        return sorted(names)
+
+    def handle(self, *args, **options):
+        jobs = []
+        for name in self.image_names():
+            source = os.path.join(settings.MEDIA_ROOT, name)
+            targets = missing_targets(name)
+            if not targets:
+                continue
+            if not os.path.exists(source):
+                self.stderr.write(f"Missing source image: {name}")
+                continue
+            jobs.append((source, targets))
+
+        written = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [(source, pool.submit(render_all, source, targets)) for source, targets in jobs]
+            for source, future in futures:
+                try:
+                    written += future.result()
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"{source}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} thumbnails for {len(jobs)} images ({failed} failed)."))
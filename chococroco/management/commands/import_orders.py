@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco.importer import BATCH_SIZE, import_orders, read_rows
+
+
+class Command(BaseCommand):
+    help = ("Bulk import orders from a CSV or XLSX file. Columns: customer_name, product_name and optionally "
+            "customer_phone, customer_email, customer_address, size, category, quantity, sell_price, cost_price, "
+            "delivery_cost, other_expense, received_amount, order_status, created_at.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in ('csv', 'xlsx'):
+            raise CommandError("Use a .csv or .xlsx file, or pass --format.")
+        mode = 'rb' if file_format == 'xlsx' else 'r'
+        with open(options['path'], mode, **({} if mode == 'rb' else {'newline': '', 'encoding': 'utf-8-sig'})) as handle:
+            result = import_orders(read_rows(handle, file_format), batch_size=options['batch_size'])
+        for line, message in result.errors[:50]:
+            self.stderr.write(f"Row {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(str(result)))
@@ -0,0 +1,36 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from chococroco.ledger import import_payments
+from chococroco.models import Order, Payment
+
+
+class Command(BaseCommand):
+    help = "Import payments from a CSV file (order_id, amount, method, payment_date) and update their orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        payments = []
+        with open(options['path'], newline='', encoding='utf-8') as handle:
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                try:
+                    payment = Payment(order_id=int(row['order_id']), amount=Decimal(row['amount']),
+                                      method=row.get('method') or 'cash')
+                except (KeyError, ValueError, InvalidOperation) as exc:
+                    raise CommandError(f"Line {line}: {exc!r}")
+                if row.get('payment_date'):
+                    payment.payment_date = parse_datetime(row['payment_date'])
+                payments.append(payment)
+
+        order_ids = {payment.order_id for payment in payments}
+        missing = order_ids - set(Order.objects.filter(pk__in=order_ids).values_list('pk', flat=True))
+        if missing:
+            raise CommandError(f"Unknown orders: {sorted(missing)}")
+
+        count, orders = import_payments(payments)
+        self.stdout.write(self.style.SUCCESS(f"Imported {count} payments for {orders} orders."))
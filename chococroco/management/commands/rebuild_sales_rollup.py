@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco import report_cache, rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup from the raw orders, or check it against them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only compare the rollup with the raw orders, do not rebuild.")
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rollups.rebuild()
+            report_cache.invalidate_all()
+            self.stdout.write(self.style.SUCCESS("Daily sales rollup rebuilt."))
+        mismatches = rollups.check()
+        for key, stored, expected in mismatches[:20]:
+            self.stderr.write(f"{key}: rollup={stored} orders={expected}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollup rows differ from the raw orders.")
+        self.stdout.write(self.style.SUCCESS("Daily sales rollup matches the raw orders."))
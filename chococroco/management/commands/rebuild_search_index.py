@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for customers and products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', metavar='kind',
+                            help=f"What to rebuild ({', '.join(sorted(search.DOCUMENTS))}); default all.")
+
+    def handle(self, *args, **options):
+        if not search.supported():
+            raise CommandError("Full-text search needs SQLite or PostgreSQL.")
+        unknown = set(options['kinds']) - set(search.DOCUMENTS)
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+        for kind in options['kinds'] or sorted(search.DOCUMENTS):
+            search.rebuild(kind)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt the {kind} search index."))
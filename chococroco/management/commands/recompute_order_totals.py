@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco.models import Order
+from chococroco.recompute import BATCH_SIZE, drift, recompute_and_sync
+
+
+class Command(BaseCommand):
+    help = "Recompute stored order totals, pending amounts and profit with set-based updates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, nargs='+', dest='products',
+                            help="Only orders for these product ids.")
+        parser.add_argument('--status', choices=[choice for choice, _ in Order.STATUS_CHOICES],
+                            help="Only orders with this order status.")
+        parser.add_argument('--reprice', action='store_true',
+                            help="Take unit prices from the current product prices first.")
+        parser.add_argument('--verify', action='store_true',
+                            help="Report orders whose stored values drift from the computed ones; write nothing.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['products']:
+            orders = orders.filter(product__in=options['products'])
+        if options['status']:
+            orders = orders.filter(order_status=options['status'])
+
+        if options['verify']:
+            drifted = drift(orders)
+            count = drifted.count()
+            for order in drifted.order_by('pk')[:20]:
+                self.stdout.write(
+                    f"Order {order.pk}: total {order.total} -> {order.expected_total}, "
+                    f"pending {order.pending_amount} -> {order.expected_pending}, "
+                    f"profit {order.profit_amount} -> {order.expected_profit}"
+                )
+            if count:
+                raise CommandError(f"{count} orders have drifted from their computed totals.")
+            self.stdout.write(self.style.SUCCESS("Stored order totals match the computed values."))
+            return
+
+        updated = recompute_and_sync(orders, products=options['products'], reprice=options['reprice'],
+                                     batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {updated} orders."))
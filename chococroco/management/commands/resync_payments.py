@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chococroco.ledger import out_of_sync, resync
+from chococroco.models import Order
+
+
+class Command(BaseCommand):
+    help = "Rebuild order received/pending amounts and payment status from the payments table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only list orders whose received amount differs from their payments.")
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            drifted = out_of_sync(Order.objects.all())
+            for order in drifted.order_by('pk')[:20]:
+                self.stdout.write(f"Order {order.pk}: received {order.received_amount}, payments {order.paid}")
+            count = drifted.count()
+            if count:
+                raise CommandError(f"{count} orders are out of sync with their payments.")
+            self.stdout.write(self.style.SUCCESS("All orders match their payments."))
+            return
+        updated = resync(Order.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Resynced {updated} orders."))
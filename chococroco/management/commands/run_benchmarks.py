@@ -0,0 +1,212 @@
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from chococroco import invoice_cache, report_cache, sampledata
+from chococroco.models import Customer, Order, Payment, Product
+
+
+def consume(response):
+    # Streaming responses only do their work while being read
+    if getattr(response, 'streaming', False):
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    if hasattr(response, 'close'):
+        response.close()
+    return response.status_code, size
+
+
+def regressions(results, baseline, tolerance):
+    # (size, scenario, what) for every figure that got worse than the baseline allows
+    previous = {(run['orders'], name): figures
+                for run in baseline.get('runs', []) for name, figures in run['scenarios'].items()}
+    found = []
+    for run in results['runs']:
+        for name, figures in run['scenarios'].items():
+            before = previous.get((run['orders'], name))
+            if not before:
+                continue
+            if figures['queries'] > before['queries']:
+                found.append((run['orders'], name, f"queries {before['queries']} -> {figures['queries']}"))
+            if figures['median_ms'] > before['median_ms'] * tolerance:
+                found.append((run['orders'], name, f"median {before['median_ms']}ms -> {figures['median_ms']}ms"))
+    return found
+
+
+class Command(BaseCommand):
+    help = ("Time and count queries for the admin changelist and change view, the order report, the CSV exports, "
+            "invoices and delivery slips at several data sizes. Runs against a throwaway test database and media "
+            "directory and writes the results as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help="Comma separated order counts (ascending).")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', default='benchmarks.json')
+        parser.add_argument('--baseline', help="Earlier results file to compare against.")
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help="Flag scenarios whose median time grew by more than this factor.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',') if size.strip()})
+        except ValueError:
+            raise CommandError("--sizes takes comma separated integers")
+        if not sizes or sizes[0] < 1:
+            raise CommandError("--sizes needs at least one positive order count")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'runs': [],
+        }
+        media_root = tempfile.mkdtemp(prefix='chococroco-bench-')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Other aliases (the read-only report connection) read the throwaway database too
+        mirrored = {alias: connections[alias].settings_dict for alias in connections if alias != DEFAULT_DB_ALIAS}
+        for alias in mirrored:
+            connections[alias].close()
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            # A report cache of its own, so the throwaway database's results never reach the shared one
+            reports = dict(settings.CACHES['reports'], LOCATION=os.path.join(media_root, 'report_cache'))
+            with override_settings(MEDIA_ROOT=media_root, CACHES=dict(settings.CACHES, reports=reports)):
+                client = Client()
+                client.force_login(get_user_model().objects.create_superuser('benchmark', 'bench@example.com', 'x'))
+                generated = 0
+                for size in sizes:
+                    self.stdout.write(f"Generating data for {size} orders...")
+                    sampledata.generate(customers=max(1, (size - generated) // 10),
+                                        products=max(1, (size - generated) // 200),
+                                        orders=size - generated, images=5 if not generated else 0,
+                                        seed=options['seed'] + size)
+                    generated = size
+                    run = {'orders': size, 'customers': Customer.objects.count(),
+                           'products': Product.objects.count(), 'scenarios': {}}
+                    for name, scenario in self.scenarios(client).items():
+                        run['scenarios'][name] = self.measure(scenario, options['repeat'])
+                        self.report(name, run['scenarios'][name])
+                    results['runs'].append(run)
+        finally:
+            for alias, settings_dict in mirrored.items():
+                connections[alias].close()
+                connections[alias].settings_dict = settings_dict
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        with open(options['output'], 'w') as handle:
+            json.dump(results, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if baseline:
+            found = regressions(results, baseline, options['tolerance'])
+            for size, name, what in found:
+                self.stderr.write(f"{size} orders, {name}: {what}")
+            if found:
+                raise CommandError(f"{len(found)} regressions against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def scenarios(self, client):
+        changelist = reverse('admin:chococroco_order_changelist')
+        order = Order.objects.order_by('-created_at', '-id').first()
+        today = timezone.localdate()
+        month_ago = (today - timedelta(days=30)).isoformat()
+        customer_name = Customer.objects.values_list('name', flat=True).first()
+
+        def action(model, name):
+            # "Select all" on the changelist, so exports grow with the data size; run in the request rather than
+            # queued as a background job, to time the export itself
+            url = reverse(f'admin:chococroco_{model._meta.model_name}_changelist')
+            first = model.objects.values_list('pk', flat=True).first()
+
+            def post():
+                with override_settings(JOBS_INLINE_MAX_ROWS=None):
+                    return client.post(url, {'action': name, 'select_across': 1, 'index': 0,
+                                             '_selected_action': [first]})
+            return post
+
+        def report(params=None):
+            # Measured without the report result cache; the cached case is its own scenario
+            report_cache.cache().clear()
+            return client.get(reverse('order_report'), params)
+
+        def cold_invoice():
+            invoice_cache.invalidate([order.pk])
+            return client.get(reverse('admin:order-invoice', args=[order.pk]))
+
+        def model_invoice():
+            return Order.objects.select_related('customer', 'product').get(pk=order.pk).generate_invoice()
+
+        return {
+            'changelist': lambda: client.get(changelist),
+            'changelist: status filter': lambda: client.get(changelist, {'order_status__exact': 'pending'}),
+            'changelist: category filter': lambda: client.get(changelist, {'product__category__id__exact': 1}),
+            'changelist: search': lambda: client.get(changelist, {'q': customer_name}),
+            'change view': lambda: client.get(reverse('admin:chococroco_order_change', args=[order.pk])),
+            'order report': report,
+            'order report: last 30 days': lambda: report({'start_date': month_ago, 'end_date': today.isoformat()}),
+            'order report: status': lambda: report({'status': 'paid'}),
+            'order report: 30 days + status': lambda: report({
+                'start_date': month_ago, 'end_date': today.isoformat(), 'status': 'pending'}),
+            'order report (cached)': lambda: client.get(reverse('order_report')),
+            'export: customers csv': action(Customer, 'export_as_csv'),
+            'export: products csv': action(Product, 'export_as_csv'),
+            'export: orders csv': action(Order, 'export_as_csv'),
+            'export: profit/loss csv': action(Order, 'export_profit_loss_csv'),
+            'export: payments csv': action(Payment, 'export_as_csv'),
+            'invoice: generate_invoice': model_invoice,
+            'invoice: admin view (cold cache)': cold_invoice,
+            'invoice: admin view (cached)': lambda: client.get(reverse('admin:order-invoice', args=[order.pk])),
+            'delivery slip': lambda: client.get(reverse('admin:chococroco_order-delivery-slip', args=[order.pk])),
+        }
+
+    def measure(self, scenario, repeat):
+        timings = []
+        for _ in range(repeat):
+            # Queries on every connection, including the read-only report alias
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                status, size = consume(scenario())
+                timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'status': status,
+            'bytes': size,
+            'queries': sum(len(queries) for queries in captured),
+            'min_ms': round(min(timings), 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'max_ms': round(max(timings), 2),
+        }
+
+    def report(self, name, figures):
+        line = f"  {name}: {figures['median_ms']}ms median, {figures['queries']} queries"
+        if figures['status'] != 200:
+            line = self.style.WARNING(f"{line} (HTTP {figures['status']})")
+        self.stdout.write(line)
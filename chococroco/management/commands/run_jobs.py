@@ -0,0 +1,73 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chococroco import jobs
+
+HEARTBEAT_EVERY = 30  # seconds
+PURGE_EVERY = 3600  # seconds
+
+
+class Command(BaseCommand):
+    help = ("Run queued background jobs (large exports, invoice downloads, order report workbooks) from the job "
+            "table, several at once in a thread pool. Needs no broker: start one or more of these next to the web "
+            "server. Jobs left running by a worker that died are queued again after JOBS_STALE_AFTER seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOBS_WORKER_THREADS)
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between looks at an empty queue.")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        threads = max(1, options['threads'])
+        self.stdout.write(f"Worker {worker} running up to {threads} jobs at once")
+        running = {}
+        last_heartbeat = last_purge = 0.0
+        with ThreadPoolExecutor(threads) as pool:
+            try:
+                while True:
+                    close_old_connections()
+                    for future, progress in list(running.items()):
+                        if future.done():
+                            self.finished(running.pop(future).job, future)
+                        else:
+                            jobs.save_progress(progress)
+
+                    now = time.monotonic()
+                    if now - last_heartbeat >= HEARTBEAT_EVERY:
+                        jobs.heartbeat(worker)
+                        requeued, failed = jobs.requeue_stale()
+                        if requeued or failed:
+                            self.stdout.write(f"Stale jobs: {requeued} queued again, {failed} failed")
+                        last_heartbeat = now
+                    if now - last_purge >= PURGE_EVERY:
+                        purged = jobs.purge()
+                        if purged:
+                            self.stdout.write(f"Removed {purged} old jobs")
+                        last_purge = now
+
+                    job = jobs.claim(worker) if len(running) < threads else None
+                    if job is not None:
+                        self.stdout.write(f"Job {job.pk}: {jobs.title(job.kind)} started")
+                        progress = jobs.Progress(job)
+                        running[pool.submit(jobs.run, job, progress)] = progress
+                        continue
+                    if options['once'] and not running:
+                        break
+                    time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                self.stdout.write(f"Stopping; waiting for {len(running)} running jobs")
+                for future, progress in running.items():
+                    self.finished(progress.job, future)
+
+    def finished(self, job, future):
+        if future.result():
+            self.stdout.write(self.style.SUCCESS(f"Job {job.pk}: {jobs.title(job.kind)} done"))
+        else:
+            self.stderr.write(f"Job {job.pk}: {jobs.title(job.kind)} failed")
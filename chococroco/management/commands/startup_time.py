@@ -0,0 +1,71 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Only needed by particular views and commands, so they should not load at startup
+HEAVY_MODULES = ('reportlab', 'pandas', 'numpy', 'openpyxl', 'PIL')
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def parse_importtime(output):
+    # module -> (cumulative µs, nesting level) for the modules python -X importtime reported
+    modules = {}
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(2)), (len(match.group(3)) - 1) // 2)
+    return modules
+
+
+class Command(BaseCommand):
+    help = ("Measure how long `manage.py check` takes to start, using python -X importtime, and list the heavy "
+            "optional libraries it imports. Fails if any of --forbid are imported or --max-ms is exceeded.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15, help="Show the slowest top-level imports.")
+        parser.add_argument('--forbid', default='', help="Comma separated packages that must not load at startup, "
+                                                         f"e.g. {','.join(HEAVY_MODULES)}.")
+        parser.add_argument('--max-ms', type=float, help="Fail if the median wall time exceeds this.")
+
+    def run_check(self):
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', manage, 'check', '-v0'],
+                                 capture_output=True, text=True, cwd=settings.BASE_DIR)
+        elapsed = (time.perf_counter() - started) * 1000
+        if process.returncode:
+            raise CommandError(f"manage.py check failed:\n{process.stderr[-2000:]}")
+        return elapsed, parse_importtime(process.stderr)
+
+    def handle(self, *args, **options):
+        timings = []
+        modules = {}
+        for _ in range(max(1, options['runs'])):
+            elapsed, modules = self.run_check()
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        top_level = {name: cumulative for name, (cumulative, level) in modules.items() if level == 0}
+        total = sum(top_level.values())
+
+        self.stdout.write(f"manage.py check: {median:.0f}ms median wall time over {len(timings)} runs "
+                          f"(min {min(timings):.0f}ms), {total / 1000:.0f}ms in imports, {len(modules)} modules")
+        self.stdout.write("Slowest top-level imports:")
+        slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:options['top']]
+        for name, cumulative in slowest:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}ms  {name}")
+        loaded = [name for name in HEAVY_MODULES if name in modules]
+        self.stdout.write(f"Heavy libraries loaded at startup: {', '.join(loaded) or 'none'}")
+
+        forbidden = [name for name in options['forbid'].split(',') if name and name in modules]
+        if forbidden:
+            raise CommandError(f"Imported at startup: {', '.join(forbidden)}")
+        if options['max_ms'] and median > options['max_ms']:
+            raise CommandError(f"Startup took {median:.0f}ms, more than {options['max_ms']:.0f}ms")
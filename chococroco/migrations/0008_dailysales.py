@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_rollup(apps, schema_editor):
+    Order = apps.get_model('chococroco', 'Order')
+    DailySales = apps.get_model('chococroco', 'DailySales')
+    cost = ExpressionWrapper(
+        F('product__cost_price') * F('quantity') + F('delivery_cost') + F('other_expense'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    rows = (Order.objects.order_by()
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'product_id', 'product__category_id', 'order_status')
+            .annotate(sum_total=Sum('total'), sum_profit=Sum('profit_amount'), sum_cost=Sum(cost),
+                      sum_quantity=Sum('quantity'), orders=Count('id')))
+    DailySales.objects.bulk_create((
+        DailySales(day=row['day'], product_id=row['product_id'], category_id=row['product__category_id'],
+                   order_status=row['order_status'], total=row['sum_total'], profit_amount=row['sum_profit'],
+                   cost=row['sum_cost'], quantity=row['sum_quantity'], order_count=row['orders'])
+        for row in rows.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chococroco', '0007_order_profit_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('profit_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('order_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='chococroco.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='chococroco.product')),
+            ],
+            options={
+                'verbose_name_plural': 'daily sales',
+                'indexes': [models.Index(fields=['day', 'order_status'], name='dailysales_day_status')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'product', 'order_status'), name='dailysales_day_product_status')],
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
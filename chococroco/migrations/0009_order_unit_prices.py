@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:01
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_unit_prices(apps, schema_editor):
+    Order = apps.get_model('chococroco', 'Order')
+    Product = apps.get_model('chococroco', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    last_id = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        Order.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+            unit_sell_price=Subquery(product.values('sell_price')[:1]),
+            unit_cost_price=Subquery(product.values('cost_price')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+    atomic = False  # each batch commits on its own
+
+    dependencies = [
+        ('chococroco', '0008_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='unit_cost_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unit_sell_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+    ]
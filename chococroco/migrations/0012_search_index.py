@@ -0,0 +1,49 @@
+from django.db import migrations
+
+KINDS = {
+    'customer': ('chococroco_customer', ('name', 'phone', 'email', 'address')),
+    'product': ('chococroco_product', ('name', 'display_name')),
+}
+
+
+def create_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for kind, (source, fields) in KINDS.items():
+            name = f"chococroco_search_{kind}"
+            body = " || ' ' || ".join(f"COALESCE({field}, '')" for field in fields)
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"CREATE VIRTUAL TABLE {name} USING fts5(body, tokenize='trigram')")
+                cursor.execute(f"INSERT INTO {name} (rowid, body) SELECT id, {body} FROM {source}")
+            else:
+                cursor.execute(
+                    f"CREATE TABLE {name} (object_id bigint PRIMARY KEY, body text NOT NULL, "
+                    f"document tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED)"
+                )
+                cursor.execute(f"CREATE INDEX {name}_document ON {name} USING gin (document)")
+                cursor.execute(f"CREATE INDEX {name}_trgm ON {name} USING gin (body gin_trgm_ops)")
+                cursor.execute(f"INSERT INTO {name} (object_id, body) SELECT id, {body} FROM {source}")
+
+
+def drop_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for kind in KINDS:
+            cursor.execute(f"DROP TABLE IF EXISTS chococroco_search_{kind}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chococroco', '0011_order_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:07
+
+import os
+
+import chococroco.storage
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    MediaBlob = apps.get_model('chococroco', 'MediaBlob')
+    counts = {}
+    for model_name in ('Order', 'Product'):
+        model = apps.get_model('chococroco', model_name)
+        rows = model.objects.exclude(image='').exclude(image__isnull=True).values('image').annotate(n=Count('pk'))
+        for row in rows:
+            counts[row['image']] = counts.get(row['image'], 0) + row['n']
+    blobs = []
+    for name, count in counts.items():
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        blobs.append(MediaBlob(name=name, refcount=count, size=os.path.getsize(path) if os.path.exists(path) else 0))
+    MediaBlob.objects.bulk_create(blobs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chococroco', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=chococroco.storage.media_storage, upload_to='order_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=chococroco.storage.media_storage, upload_to='product_images/'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Indexes for the admin autocomplete's case-insensitive prefix step (search.prefix_match)
+FIELDS = {
+    'chococroco_customer': ('name', 'phone', 'email'),
+    'chococroco_product': ('name', 'display_name'),
+}
+
+
+def create_prefix_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for source, fields in FIELDS.items():
+            for field in fields:
+                if connection.vendor == 'sqlite':
+                    cursor.execute(f"CREATE INDEX {source}_{field}_nocase ON {source} ({field} COLLATE NOCASE)")
+                else:
+                    cursor.execute(
+                        f"CREATE INDEX {source}_{field}_prefix ON {source} (UPPER({field}::text) text_pattern_ops)"
+                    )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    suffix = 'nocase' if connection.vendor == 'sqlite' else 'prefix'
+    with connection.cursor() as cursor:
+        for source, fields in FIELDS.items():
+            for field in fields:
+                cursor.execute(f"DROP INDEX IF EXISTS {source}_{field}_{suffix}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chococroco', '0014_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
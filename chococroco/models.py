@@ -1,17 +1,17 @@
-from django.db import models
-from django.utils import timezone
-from django.http import FileResponse
 import io
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Value
+from django.utils import timezone
+from .profiling import span
+from .storage import media_storage
 
 
 class Customer(models.Model):
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
     email = models.EmailField(blank=True, null=True)
-    phone = models.CharField(max_length=30, blank=True, null=True)
+    phone = models.CharField(max_length=30, blank=True, null=True, db_index=True)
     address = models.TextField(blank=True, null=True)
 
     def __str__(self):
@@ -33,22 +33,25 @@ class Size(models.Model):
 
 
 class Product(models.Model):
-    display_name = models.CharField(max_length=200, blank=True, null=True)
-    name = models.CharField(max_length=200)
+    display_name = models.CharField(max_length=200, blank=True, null=True, db_index=True)
+    name = models.CharField(max_length=200, db_index=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     size = models.ForeignKey(Size, on_delete=models.SET_NULL, null=True, blank=True)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     sell_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    image = models.ImageField(upload_to='product_images/', blank=True, null=True)  # Added image field
+    image = models.ImageField(upload_to='product_images/', storage=media_storage, blank=True, null=True)  # Added image field
 
     def __str__(self):
         return self.display_name if self.display_name else self.name
 
-    def save(self, *args, **kwargs):
+    def set_display_name(self):
         if self.size:
             self.display_name = f"{self.name} - {self.size.name}"
         else:
             self.display_name = self.name
+
+    def save(self, *args, **kwargs):
+        self.set_display_name()
         super().save(*args, **kwargs)
 
 
@@ -67,6 +70,8 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    unit_sell_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # product prices when ordered
+    unit_cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     delivery_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     other_expense = models.DecimalField(max_digits=10, decimal_places=2, default=0) # ADDED other expense
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -76,93 +81,83 @@ class Order(models.Model):
     payment_status = models.CharField(max_length=20, choices=PAYMENT_CHOICES, default='pending')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
-    image = models.ImageField(upload_to='order_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='order_images/', storage=media_storage, blank=True, null=True)
     profit_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0) # Added profit amount
 
+    LEDGER_FIELDS = ('received_amount', 'pending_amount', 'payment_status')
+
+    class Meta:
+        # Matched to the admin filters, the report's date range / status queries and the API's updated_at filter
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_id'),
+            models.Index(fields=['order_status', 'created_at'], name='order_status_created'),
+            models.Index(fields=['payment_status', 'created_at'], name='order_payment_created'),
+            models.Index(fields=['updated_at', 'id'], name='order_updated_id'),  # API change polling
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        return instance
+
+    def snapshot_prices(self):
+        self.unit_sell_price = self.product.sell_price
+        self.unit_cost_price = self.product.cost_price
+
     def product_total(self):
-        return self.product.sell_price * self.quantity
+        return self.unit_sell_price * self.quantity
 
     def order_total(self):
         return self.product_total() + self.delivery_cost
 
     def profit(self):
-        return (self.product.sell_price - self.product.cost_price) * self.quantity - self.other_expense
+        return (self.unit_sell_price - self.unit_cost_price) * self.quantity - self.other_expense
 
     def cost_total(self):
-        return self.product.cost_price * self.quantity + self.delivery_cost + self.other_expense
+        return self.unit_cost_price * self.quantity + self.delivery_cost + self.other_expense
 
-    def save(self, *args, **kwargs):
+    def compute_totals(self):
+        # Prices are taken from the product when the order is created or its product changes
+        if self._state.adding or self.product_id != getattr(self, '_loaded_product_id', self.product_id):
+            self.snapshot_prices()
+        self._loaded_product_id = self.product_id
         self.total = self.order_total()
         self.pending_amount = self.total - self.received_amount
         self.profit_amount = self.profit() # Calculate and store profit
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        from .ledger import balance_fields, status_for
+        self.compute_totals()
+        if self._state.adding or kwargs.get('force_insert'):
+            self.payment_status = status_for(self.received_amount, self.pending_amount, self.payment_status)
+            with transaction.atomic():
+                return super().save(*args, **kwargs)
+        # The ledger's atomic updates own the received amount; this copy of it may be older than the row, so the
+        # balance is worked out from the stored one in the same UPDATE
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in self.LEDGER_FIELDS]
+        update_fields = [name for name in update_fields if name not in self.LEDGER_FIELDS]
+        total = Value(self.total, output_field=self._meta.get_field('total')) if 'total' in update_fields else None
+        for name, value in balance_fields(total=total).items():
+            setattr(self, name, value)
+        kwargs['update_fields'] = update_fields + ['pending_amount', 'payment_status']
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=self.LEDGER_FIELDS)
 
     def __str__(self):
         return f"Order {self.id} - {self.customer.name}"
 
     # ✅ Invoice PDF generator
     def generate_invoice(self):
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-        styles = getSampleStyleSheet()
-
-        # --- Header ---
-        company_info = Paragraph(
-            "<b>ChocoCroco Pvt Ltd</b><br/>123, Sweet Street<br/>Chennai, India<br/>Phone: +91-9876543210",
-            styles['Normal']
-        )
-        header_table = Table([["Company Logo", company_info]], colWidths=[120, 380])
-        elements.append(header_table)
-        elements.append(Spacer(1, 20))
-
-        # --- Customer + Order Info ---
-        customer_details = Paragraph(
-            f"<b>Customer:</b> {self.customer.name}<br/>{self.customer.address}",
-            styles['Normal']
-        )
-        order_details = Paragraph(
-            f"<b>Order No:</b> {self.id}<br/><b>Date:</b> {self.created_at.strftime('%d-%m-%Y')}",
-            styles['Normal']
-        )
-        cust_order_table = Table([[customer_details, order_details]], colWidths=[250, 250])
-        elements.append(cust_order_table)
-        elements.append(Spacer(1, 20))
-
-        # --- Order Items Table ---
-        data = [["Product", "Quantity", "Rate", "Total"]]
-        data.append([
-            self.product.display_name if self.product.display_name else self.product.name,
-            self.quantity,
-            f"₹{self.product.sell_price}",
-            f"₹{self.product_total()}",
-        ])
-
-        data.append(["", "", "Subtotal", f"₹{self.product_total()}"])
-        data.append(["", "", "Delivery Cost", f"₹{self.delivery_cost}"])
-        data.append(["", "", "Other Expense", f"₹{self.other_expense}"]) # ADDED other expense
-        data.append(["", "", "Grand Total", f"₹{self.total}"])
-        data.append(["", "", "Profit", f"₹{self.profit_amount}"]) # Added profit amount
-
-        table = Table(data, colWidths=[200, 80, 100, 100])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#f2f2f2")),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 20))
-
-        # --- Footer ---
-        footer = Paragraph(
-            "<b>Thanks for your order!</b><br/>Follow us on Instagram, Facebook, YouTube",
-            styles['Normal']
-        )
-        elements.append(footer)
-
-        doc.build(elements)
-        buffer.seek(0)
+        # Imported here so loading the models does not pull in the PDF renderer
+        from django.http import FileResponse
+        from .invoices import invoice_data, render_invoice
+        with span('pdf_render'):
+            buffer = io.BytesIO(render_invoice(invoice_data(self)))
         return FileResponse(buffer, as_attachment=True, filename=f"invoice_{self.id}.pdf")
 
 
@@ -178,3 +173,77 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Payment {self.id} - {self.amount}"
+
+
+class DailySales(models.Model):
+    # Pre-aggregated order figures per day x category x product x status
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    order_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    profit_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantity = models.BigIntegerField(default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product', 'order_status'], name='dailysales_day_product_status'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'order_status'], name='dailysales_day_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.product_id} - {self.order_status}"
+
+
+class MediaBlob(models.Model):
+    # One stored image file and how many order/product rows point at it
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    # An export or report run by `manage.py run_jobs` instead of the request; its file is kept under MEDIA_ROOT/jobs
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    artifact = models.CharField(max_length=255, blank=True)  # path under MEDIA_ROOT
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - {self.kind} ({self.status})"
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        return min(99, self.progress * 100 // self.total) if self.total else 0
@@ -0,0 +1,30 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+COUNT_CAP = 10000
+
+
+class CappedCountPaginator(Paginator):
+    # Avoids a full COUNT(*) on big tables: PostgreSQL's planner estimate for an
+    # unfiltered list, otherwise a count that stops after COUNT_CAP + 1 rows.
+    count_cap = COUNT_CAP
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        estimate = self.estimated_count(queryset)
+        if estimate is not None and estimate > self.count_cap:
+            return estimate
+        capped = queryset.order_by()[:self.count_cap + 1].count()
+        return min(capped, self.count_cap)
+
+    def estimated_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] > 0 else None
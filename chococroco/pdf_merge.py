@@ -0,0 +1,92 @@
+import re
+
+# Joins the single-invoice PDFs ReportLab writes (plain xref table, one page tree) into one document, a file at a
+# time, so merged invoices can be rendered across the process pool and streamed without holding them all
+
+XREF = re.compile(rb'xref\s+0 (\d+)\s+')
+ENTRY = re.compile(rb'(\d{10}) \d{5} ([fn])')
+STARTXREF = re.compile(rb'startxref\s+(\d+)')
+OBJECT = re.compile(rb'\d+ 0 obj\s*(.*?)\s*endobj\s*$', re.S)
+REFERENCE = re.compile(rb'(\d+) 0 R\b')
+ROOT = re.compile(rb'/Root (\d+) 0 R')
+INFO = re.compile(rb'/Info (\d+) 0 R')
+KIDS = re.compile(rb'/Kids \[([^\]]*)\]')
+
+PAGES = 1  # object numbers of the merged page tree and catalog, written last
+CATALOG = 2
+
+
+def objects(pdf):
+    # {number: body} of a PDF's objects, cut out at the offsets its xref table gives
+    start = int(STARTXREF.findall(pdf)[-1])
+    table = XREF.match(pdf, start)
+    entries = ENTRY.findall(pdf, table.end())[:int(table.group(1))]
+    offsets = {number: int(offset) for number, (offset, kind) in enumerate(entries) if kind == b'n'}
+    ends = sorted(offsets.values()) + [start]
+    found = {}
+    for number, offset in offsets.items():
+        end = ends[ends.index(offset) + 1]
+        found[number] = OBJECT.match(pdf[offset:end]).group(1)
+    return found, pdf[start:]
+
+
+def is_type(body, name):
+    return re.search(rb'/Type /%s\b' % name, body.split(b'\nstream', 1)[0]) is not None
+
+
+def page_order(found, node):
+    # Page object numbers under a page tree node, in reading order
+    kids = KIDS.search(found[node])
+    pages = []
+    for kid in REFERENCE.findall(kids.group(1)) if kids else ():
+        kid = int(kid)
+        pages.extend(page_order(found, kid) if is_type(found[kid], b'Pages') else [kid])
+    return pages
+
+
+def merge(pdfs):
+    # Yields the merged PDF piece by piece, one input document after the other
+    header = b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n'
+    yield header
+    position = len(header)
+    offsets = {}
+    kids = []
+    next_number = CATALOG + 1
+    for pdf in pdfs:
+        found, trailer = objects(pdf)
+        root = int(ROOT.search(trailer).group(1))
+        skip = {root} | {int(number) for number in INFO.findall(trailer)}
+        tree = {number for number, body in found.items() if is_type(body, b'Pages')}
+        root_pages = int(re.search(rb'/Pages (\d+) 0 R', found[root]).group(1))
+        numbers = {}
+        for number in sorted(found):
+            if number not in skip and number not in tree:
+                numbers[number] = next_number
+                next_number += 1
+
+        def renumber(match):
+            number = int(match.group(1))
+            return b'%d 0 R' % (PAGES if number in tree else numbers[number])
+
+        for number, new in numbers.items():
+            body = found[number]
+            head, stream, data = body.partition(b'\nstream')
+            chunk = b'%d 0 obj\n%s%s%s\nendobj\n' % (new, REFERENCE.sub(renumber, head), stream, data)
+            offsets[new] = position
+            position += len(chunk)
+            yield chunk
+        kids.extend(numbers[page] for page in page_order(found, root_pages))
+
+    tail = [
+        (PAGES, b'<< /Type /Pages /Count %d /Kids [ %s ] >>' % (len(kids), b' '.join(b'%d 0 R' % kid for kid in kids))),
+        (CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES),
+    ]
+    for number, body in tail:
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        offsets[number] = position
+        position += len(chunk)
+        yield chunk
+    xref = [b'xref\n0 %d\n' % next_number, b'0000000000 65535 f \n']
+    xref += [b'%010d 00000 n \n' % offsets[number] for number in range(1, next_number)]
+    yield b''.join(xref) + b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+        next_number, CATALOG, position)
@@ -0,0 +1,242 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.db import connections
+from django.http.request import RawPostDataException
+from django.utils import timezone
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+FORM_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+_lock = threading.Lock()
+_buffer = None
+_current = threading.local()
+
+
+def buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = deque(maxlen=settings.REQUEST_STATS_BUFFER_SIZE)
+    return _buffer
+
+
+def query_shape(sql):
+    # Django passes parameters separately, so only IN lists vary between calls of the same query
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.spans = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def entry(self, request, response):
+        match = request.resolver_match
+        key = match.view_name if match else request.path
+        action = admin_action(request)
+        if action:
+            key = f"{key} [{action}]"
+        threshold = settings.REQUEST_STATS_DUPLICATE_THRESHOLD
+        return {
+            'at': timezone.now().isoformat(),
+            'key': key,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'duplicates': [[shape, count] for shape, count in self.shapes.most_common(3) if count >= threshold],
+            'spans': {name: round(seconds * 1000, 2) for name, seconds in self.spans.items()},
+        }
+
+
+def admin_action(request):
+    if request.method != 'POST' or request.content_type not in FORM_TYPES:
+        return None
+    try:
+        return request.POST.get('action')
+    except (RawPostDataException, SuspiciousOperation):
+        return None
+
+
+@contextmanager
+def span(name):
+    # Times a block (e.g. PDF rendering) into the current request's stats, if it is being sampled
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[name] += time.perf_counter() - started
+
+
+def record(entry):
+    with _lock:
+        buffer().append(entry)
+        full = settings.REQUEST_STATS_FLUSH_EVERY and len(buffer()) >= settings.REQUEST_STATS_FLUSH_EVERY
+    if full:
+        flush()
+
+
+def entries():
+    with _lock:
+        return list(buffer())
+
+
+def flush(sink=None):
+    # Moves the buffered entries to the JSONL file, or an SQLite table if the sink ends in .sqlite3
+    sink = sink or settings.REQUEST_STATS_SINK
+    with _lock:
+        pending = list(buffer())
+        buffer().clear()
+    if not pending:
+        return 0
+    if sink.endswith('.sqlite3'):
+        with sqlite3.connect(sink) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS request_stats (at TEXT, key TEXT, ms REAL, queries INTEGER, "
+                       "db_ms REAL, entry TEXT)")
+            db.executemany("INSERT INTO request_stats VALUES (?, ?, ?, ?, ?, ?)",
+                           [(e['at'], e['key'], e['ms'], e['queries'], e['db_ms'], json.dumps(e)) for e in pending])
+        db.close()
+    else:
+        with open(sink, 'a') as handle:
+            handle.writelines(json.dumps(entry) + '\n' for entry in pending)
+    return len(pending)
+
+
+def load_sink(sink=None, limit=50000):
+    # Most recent flushed entries
+    sink = sink or settings.REQUEST_STATS_SINK
+    if not os.path.exists(sink):
+        return []
+    if sink.endswith('.sqlite3'):
+        with sqlite3.connect(sink) as db:
+            rows = db.execute("SELECT entry FROM request_stats ORDER BY rowid DESC LIMIT ?", [limit]).fetchall()
+        db.close()
+        return [json.loads(row[0]) for row in reversed(rows)]
+    with open(sink) as handle:
+        return [json.loads(line) for line in deque(handle, maxlen=limit) if line.strip()]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarise(entries, top=10):
+    # Per key percentiles, plus the slowest requests and the most repeated query shapes
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry['key'], []).append(entry)
+    rows = []
+    for key, group in grouped.items():
+        latencies = [entry['ms'] for entry in group]
+        queries = [entry['queries'] for entry in group]
+        rows.append({
+            'key': key,
+            'count': len(group),
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies),
+            'queries': round(sum(queries) / len(group), 1),
+            'max_queries': max(queries),
+            'db_ms': round(sum(entry['db_ms'] for entry in group) / len(group), 2),
+            'pdf_ms': round(sum(entry['spans'].get('pdf_render', 0) for entry in group) / len(group), 2),
+            'n_plus_one': sum(1 for entry in group if entry['duplicates']),
+        })
+    rows.sort(key=lambda row: row['p95'], reverse=True)
+    shapes = Counter()
+    for entry in entries:
+        for shape, count in entry['duplicates']:
+            shapes[(entry['key'], shape)] = max(shapes[(entry['key'], shape)], count)
+    watched = settings.REQUEST_STATS_WATCH
+    return {
+        'keys': rows,
+        'watched': [row for row in rows if row['key'].startswith(watched)],
+        'slowest': sorted(entries, key=lambda entry: entry['ms'], reverse=True)[:top],
+        'duplicates': [{'key': key, 'shape': shape, 'count': count}
+                       for (key, shape), count in shapes.most_common(top)],
+    }
+
+
+class RequestStatsMiddleware:
+    # Samples requests into the ring buffer; unsampled requests pay for one random() call
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_STATS_SAMPLE_RATE:
+            return self.get_response(request)
+        stats = RequestStats()
+        # Every alias, so report pages reading through the 'reports' connection are counted too
+        wrappers = [connections[alias].execute_wrappers for alias in connections]
+        for installed in wrappers:
+            installed.append(stats)
+        _current.stats = stats
+
+        def uninstall():
+            for installed in wrappers:
+                if stats in installed:
+                    installed.remove(stats)
+            _current.stats = None
+
+        def finish():
+            uninstall()
+            record(stats.entry(request, response))
+
+        try:
+            response = self.get_response(request)
+        except Exception:
+            uninstall()
+            raise
+        if response.streaming and not getattr(response, 'file_to_stream', None):
+            # Streamed exports run their queries while the body is sent; files are already complete
+            response.streaming_content = Streamed(response.streaming_content, finish)
+        else:
+            finish()
+        return response
+
+
+class Streamed:
+    # Response body wrapper that calls finish() once, when it is exhausted or closed
+    def __init__(self, content, finish):
+        self.content = content
+        self.finish = finish
+
+    def __iter__(self):
+        yield from self.content
+        self.close()
+
+    def close(self):
+        if self.finish:
+            finish, self.finish = self.finish, None
+            finish()
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Round
+
+from . import invoice_cache, ledger, report_cache, rollups
+from .models import Order, Product
+from .reports import ORDER_PROFIT, ORDER_TOTAL
+
+BATCH_SIZE = 5000
+
+
+def id_batches(orders, batch_size):
+    bounds = orders.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        yield orders.filter(pk__gte=start, pk__lt=start + batch_size)
+
+
+def recompute(orders, reprice=False, batch_size=BATCH_SIZE):
+    # Refresh the stored totals in place; with reprice the unit prices are first
+    # taken again from the current product prices. Returns the number of rows updated.
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    updated = 0
+    for batch in id_batches(orders, batch_size):
+        with transaction.atomic():
+            if reprice:
+                batch.update(
+                    unit_sell_price=Subquery(product.values('sell_price')[:1]),
+                    unit_cost_price=Subquery(product.values('cost_price')[:1]),
+                )
+            # Rounded to the stored two places, since SQLite does this arithmetic in floating point
+            pending = Round(ORDER_TOTAL - F('received_amount'), 2)
+            updated += batch.update(
+                total=Round(ORDER_TOTAL, 2),
+                pending_amount=pending,
+                profit_amount=Round(ORDER_PROFIT, 2),
+                payment_status=ledger.payment_status(F('received_amount'), pending),
+            )
+    return updated
+
+
+def drift(orders):
+    # Orders whose stored totals differ from what the current columns give, rounded as recompute() writes them
+    return orders.annotate(
+        expected_total=Round(ORDER_TOTAL, 2),
+        expected_pending=Round(ORDER_TOTAL - F('received_amount'), 2),
+        expected_profit=Round(ORDER_PROFIT, 2),
+    ).filter(
+        ~Q(total=F('expected_total'))
+        | ~Q(pending_amount=F('expected_pending'))
+        | ~Q(profit_amount=F('expected_profit'))
+    )
+
+
+def recompute_and_sync(orders, products=None, reprice=False, batch_size=BATCH_SIZE):
+    # recompute() plus the derived data that update() bypasses
+    updated = recompute(orders, reprice=reprice, batch_size=batch_size)
+    if updated:
+        rollups.rebuild(products=products)
+        invoice_cache.invalidate(orders.values_list('pk', flat=True))
+        report_cache.invalidate_orders(orders)
+    return updated
+
+
+def open_orders(products):
+    return Order.objects.filter(product__in=products, order_status='pending')
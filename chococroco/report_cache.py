@@ -0,0 +1,148 @@
+import hashlib
+import uuid
+from datetime import date
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .models import Order
+from .rollups import order_day
+
+CACHE_ALIAS = 'reports'
+MAX_BUCKETS = 24  # months a cached range is checked against one by one; wider ranges count as open ended
+STATUSES = {choice for choice, _ in Order.STATUS_CHOICES}
+KINDS = ('totals', 'rows', 'analytics')
+OUTCOMES = ('hit', 'miss', 'invalidated')
+
+
+def cache():
+    return caches[CACHE_ALIAS]
+
+
+def parse_day(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def normalize(start_date=None, end_date=None, status=None):
+    # Equivalent requests share one entry: bad dates and unknown statuses mean "no filter", as in the report
+    return parse_day(start_date), parse_day(end_date), status if status in STATUSES else None
+
+
+def params(filters):
+    # Normalized filters as query string values, for the report links and forms
+    start, end, status = filters
+    return {'start_date': start and start.isoformat(), 'end_date': end and end.isoformat(), 'status': status}
+
+
+def entry_key(kind, filters, *extra):
+    start, end, status = filters
+    raw = f"{kind}|{start}|{end}|{status}|{'|'.join(str(part) for part in extra)}"
+    return f"report_cache:{kind}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def count(kind, outcome):
+    key = f"report_cache:stats:{kind}:{outcome}"
+    if not cache().add(key, 1, timeout=None):
+        try:
+            cache().incr(key)
+        except ValueError:
+            pass
+
+
+def stats():
+    # {kind: {'hit': n, 'miss': n, 'invalidated': n, 'hit_rate': %}} for tuning the timeout
+    names = {kind: [f"report_cache:stats:{kind}:{outcome}" for outcome in OUTCOMES] for kind in KINDS}
+    found = cache().get_many([name for kind in KINDS for name in names[kind]])
+    result = {}
+    for kind in KINDS:
+        result[kind] = {outcome: found.get(name, 0) for outcome, name in zip(OUTCOMES, names[kind])}
+    for figures in result.values():
+        lookups = figures['hit'] + figures['miss']
+        figures['hit_rate'] = round(figures['hit'] * 100 / lookups, 1) if lookups else 0.0
+    return result
+
+
+def months(first, last):
+    # 'YYYY-MM' buckets of a closed date range, or None if it is open ended or spans more than MAX_BUCKETS
+    if first is None or last is None:
+        return None
+    first_month, last_month = first.year * 12 + first.month - 1, last.year * 12 + last.month - 1
+    if last_month - first_month >= MAX_BUCKETS:
+        return None
+    return [f"{month // 12:04d}-{month % 12 + 1:02d}" for month in range(first_month, last_month + 1)]
+
+
+def bucket_keys(start, end):
+    # Buckets an entry for this range depends on: its months ('any' month for open or wide ranges), and 'all'
+    names = months(start, end)
+    return [f"report_cache:bucket:{name}" for name in (['any'] if names is None else names) + ['all']]
+
+
+def stamps(keys, found):
+    # Current bucket stamps; a missing (never bumped or evicted) bucket gets one, so it can't match a stale entry
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache().add(key, uuid.uuid4().hex, timeout=None)
+        found = dict(found, **cache().get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def get_or_set(kind, filters, compute, *extra):
+    # Cached result of compute() for these normalized filters, valid while the buckets of its date range
+    # keep the stamps they had when it was computed
+    key = entry_key(kind, filters, *extra)
+    start, end, _ = filters
+    keys = bucket_keys(start, end)
+    found = cache().get_many([key] + keys)
+    current = stamps(keys, found)
+    if key in found:
+        stamped, value = found[key]
+        if stamped == current:
+            count(kind, 'hit')
+            return value
+        count(kind, 'invalidated')
+    count(kind, 'miss')
+    value = compute()
+    cache().set(key, (current, value))
+    return value
+
+
+def invalidate(ranges):
+    # New stamps for the month buckets of the (first, last) ranges (None = open ended), so the entries overlapping
+    # them are recomputed on their next lookup. Each bucket is its own key: concurrent invalidations from several
+    # processes may overwrite each other's stamp, but either way it changes.
+    names = {'any'}
+    for first, last in ranges:
+        listed = months(first, last)
+        names.update(['all'] if listed is None else listed)
+    stamp = uuid.uuid4().hex
+    cache().set_many({f"report_cache:bucket:{name}": stamp for name in names}, timeout=None)
+
+
+def invalidate_on_commit(ranges):
+    # After the change is committed, so a concurrent request cannot cache the old figures again
+    ranges = [(first, last) for first, last in ranges if first or last]
+    if ranges:
+        transaction.on_commit(lambda: invalidate(ranges))
+
+
+def invalidate_days(days):
+    invalidate_on_commit([(day, day) for day in set(days) if day])
+
+
+def invalidate_orders(orders):
+    # Range spanned by a queryset of orders, for changes that touch many of them at once
+    bounds = orders.order_by().aggregate(first=Min('created_at'), last=Max('created_at'))
+    if bounds['first']:
+        invalidate_on_commit([(order_day(bounds['first']), order_day(bounds['last']))])
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: invalidate([(None, None)]))
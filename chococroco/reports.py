@@ -0,0 +1,94 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum, Count, Value
+from django.db.models.functions import Coalesce
+
+from django.utils import timezone
+
+REPORT_PAGE_SIZE = 50
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+# Same formulas as the Order methods, evaluated by the database from the order row alone
+PRODUCT_TOTAL = ExpressionWrapper(F('unit_sell_price') * F('quantity'), output_field=MONEY)
+ORDER_TOTAL = ExpressionWrapper(F('unit_sell_price') * F('quantity') + F('delivery_cost'), output_field=MONEY)
+ORDER_COST = ExpressionWrapper(
+    F('unit_cost_price') * F('quantity') + F('delivery_cost') + F('other_expense'),
+    output_field=MONEY,
+)
+ORDER_PROFIT = ExpressionWrapper(
+    (F('unit_sell_price') - F('unit_cost_price')) * F('quantity') - F('other_expense'),
+    output_field=MONEY,
+)
+
+
+def report_db():
+    # Read-only connection for report queries, when the settings define one
+    return 'reports' if 'reports' in settings.DATABASES else 'default'
+
+
+def day_start(value, days=0):
+    # Midnight (current time zone) at the start of the given YYYY-MM-DD day
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value)
+        except ValueError:
+            return None
+    return timezone.make_aware(datetime.combine(value + timedelta(days=days), time.min))
+
+
+def filter_orders(orders, start_date=None, end_date=None, status=None):
+    # Half-open datetime range so the created_at indexes apply (no __date function)
+    start = day_start(start_date) if start_date else None
+    end = day_start(end_date, days=1) if end_date else None
+    if start:
+        orders = orders.filter(created_at__gte=start)
+    if end:
+        orders = orders.filter(created_at__lt=end)
+    if status:
+        orders = orders.filter(order_status=status)
+    return orders
+
+
+def order_totals(orders):
+    # One aggregate query for every figure shown in the summary
+    zero = Value(0, output_field=MONEY)
+    totals = orders.order_by().aggregate(
+        total_sales=Coalesce(Sum('total'), zero),
+        total_profit=Coalesce(Sum('profit_amount'), zero),
+        total_cost=Coalesce(Sum(ORDER_COST), zero),
+        order_count=Count('id'),
+    )
+    return totals
+
+
+def encode_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.pk}"
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page_queryset(orders, cursor=None, page_size=REPORT_PAGE_SIZE):
+    # Keyset pagination on (created_at, id), newest first; one extra row tells if there is a next page
+    orders = orders.select_related('customer', 'product').order_by('-created_at', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    return orders[:page_size + 1]
+
+
+def order_page(orders, cursor=None, page_size=REPORT_PAGE_SIZE):
+    rows = list(page_queryset(orders, cursor, page_size))
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
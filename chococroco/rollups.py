@@ -0,0 +1,197 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Count, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import DailySales, Order, Product
+from .reports import MONEY, ORDER_COST, report_db
+
+FIGURES = ('total', 'profit_amount', 'cost', 'quantity', 'order_count')
+
+
+def order_day(created_at):
+    if timezone.is_aware(created_at):
+        return timezone.localdate(created_at)
+    return created_at.date()
+
+
+def order_contribution(order):
+    # (key, figures) one order adds to the rollup
+    key = {
+        'day': order_day(order.created_at),
+        'product_id': order.product_id,
+        'order_status': order.order_status,
+    }
+    figures = {
+        'total': order.total,
+        'profit_amount': order.profit_amount,
+        'cost': order.cost_total(),
+        'quantity': order.quantity,
+        'order_count': 1,
+    }
+    return key, figures
+
+
+def stored_contribution(order_id):
+    # Contribution of the row as it currently is in the database, locked until the caller's transaction ends (the
+    # save it is read for), so two saves of one order can't both take back the same old figures
+    row = (Order.objects.select_for_update().filter(pk=order_id)
+           .values('created_at', 'product_id', 'order_status', 'total', 'profit_amount', 'quantity')
+           .annotate(cost=ORDER_COST).first())
+    if row is None:
+        return None
+    key = {
+        'day': order_day(row['created_at']),
+        'product_id': row['product_id'],
+        'order_status': row['order_status'],
+    }
+    figures = {
+        'total': row['total'],
+        'profit_amount': row['profit_amount'],
+        'cost': row['cost'],
+        'quantity': row['quantity'],
+        'order_count': 1,
+    }
+    return key, figures
+
+
+def apply(key, figures, sign=1):
+    changes = {name: F(name) + sign * figures[name] for name in FIGURES}
+    with transaction.atomic():
+        if DailySales.objects.filter(**key).update(**changes):
+            DailySales.objects.filter(**key, order_count__lte=0).delete()
+            return
+        if sign < 0:
+            # Row already gone (e.g. cascaded product delete), nothing to remove
+            return
+        category_id = Product.objects.filter(pk=key['product_id']).values_list('category_id', flat=True).first()
+        try:
+            with transaction.atomic():
+                DailySales.objects.create(category_id=category_id, **key, **figures)
+        except IntegrityError:
+            DailySales.objects.filter(**key).update(**changes)
+
+
+def order_changed(old, new):
+    # old/new are (key, figures) pairs or None
+    if old == new:
+        return
+    # Both in one transaction, so readers never see the order taken out of one row but not yet added to the other
+    with transaction.atomic():
+        if old is not None:
+            apply(*old, sign=-1)
+        if new is not None:
+            apply(*new)
+
+
+def apply_changes(changes):
+    # Net effect of many (old, new) pairs, one write per rollup row; returns the keys touched
+    net = defaultdict(lambda: dict.fromkeys(FIGURES, 0))
+    for old, new in changes:
+        if old == new:
+            continue
+        for contribution, sign in ((old, -1), (new, 1)):
+            if contribution is not None:
+                key, figures = contribution
+                summed = net[tuple(sorted(key.items()))]
+                for name in FIGURES:
+                    summed[name] += sign * figures[name]
+    for key, figures in net.items():
+        if not any(figures.values()):
+            continue
+        # A net removal goes through apply()'s removal path, so a row that is already gone is not recreated
+        sign = -1 if figures['order_count'] < 0 else 1
+        apply(dict(key), {name: sign * value for name, value in figures.items()}, sign=sign)
+    return [dict(key) for key in net]
+
+
+def aggregate_orders(orders):
+    return (orders.order_by()
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'product_id', 'product__category_id', 'order_status')
+            .annotate(
+                sum_total=Sum('total'),
+                sum_profit=Sum('profit_amount'),
+                sum_cost=Sum(ORDER_COST),
+                sum_quantity=Sum('quantity'),
+                orders=Count('id'),
+            ))
+
+
+def rebuild(products=None, batch_size=1000):
+    orders = Order.objects.all()
+    rollup = DailySales.objects.all()
+    if products is not None:
+        orders = orders.filter(product__in=products)
+        rollup = rollup.filter(product__in=products)
+    with transaction.atomic():
+        rollup.delete()
+        DailySales.objects.bulk_create((
+            DailySales(
+                day=row['day'],
+                product_id=row['product_id'],
+                category_id=row['product__category_id'],
+                order_status=row['order_status'],
+                total=row['sum_total'],
+                profit_amount=row['sum_profit'],
+                cost=row['sum_cost'],
+                quantity=row['sum_quantity'],
+                order_count=row['orders'],
+            )
+            for row in aggregate_orders(orders).iterator()
+        ), batch_size=batch_size)
+
+
+def check():
+    # Compare the rollup with a fresh aggregation of the raw orders
+    expected = {}
+    for row in aggregate_orders(Order.objects.all()).iterator():
+        key = (row['day'], row['product_id'], row['order_status'])
+        expected[key] = (row['product__category_id'], row['sum_total'], row['sum_profit'],
+                         row['sum_cost'], row['sum_quantity'], row['orders'])
+    mismatches = []
+    for row in DailySales.objects.values_list('day', 'product_id', 'order_status', 'category_id',
+                                              *FIGURES).iterator():
+        key, stored = row[:3], row[3:]
+        wanted = expected.pop(key, None)
+        if wanted != stored:
+            mismatches.append((key, stored, wanted))
+    mismatches.extend((key, None, wanted) for key, wanted in expected.items())
+    return mismatches
+
+
+def filter_rollup(rows, start_date=None, end_date=None, status=None):
+    if start_date:
+        rows = rows.filter(day__gte=start_date)
+    if end_date:
+        rows = rows.filter(day__lte=end_date)
+    if status:
+        rows = rows.filter(order_status=status)
+    return rows
+
+
+def sales_totals(start_date=None, end_date=None, status=None):
+    zero = Value(0, output_field=MONEY)
+    rows = filter_rollup(DailySales.objects.using(report_db()), start_date, end_date, status)
+    return rows.aggregate(
+        total_sales=Coalesce(Sum('total'), zero),
+        total_profit=Coalesce(Sum('profit_amount'), zero),
+        total_cost=Coalesce(Sum('cost'), zero),
+        order_count=Coalesce(Sum('order_count'), 0),
+    )
+
+
+def monthly_profit_loss(start_date=None, end_date=None, status=None):
+    rows = filter_rollup(DailySales.objects.using(report_db()), start_date, end_date, status)
+    return (rows.annotate(month=TruncMonth('day'))
+            .values('month', 'category__name')
+            .annotate(
+                revenue=Sum('total'),
+                cost=Sum('cost'),
+                profit=Sum('profit_amount'),
+                quantity=Sum('quantity'),
+                orders=Sum('order_count'),
+            )
+            .order_by('month', 'category__name'))
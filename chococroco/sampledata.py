@@ -0,0 +1,153 @@
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import report_cache, rollups, search, storage
+from .models import Category, Customer, Order, Payment, Product, Size
+from .thumbnails import ensure_thumbnails
+
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ('Aarav', 'Aditi', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Meera', 'Neha', 'Rahul', 'Riya', 'Rohan',
+               'Sanjay', 'Sneha', 'Tanvi', 'Vikram', 'Zara')
+LAST_NAMES = ('Agarwal', 'Bose', 'Das', 'Gupta', 'Iyer', 'Joshi', 'Kapoor', 'Khan', 'Mehta', 'Nair', 'Patel',
+              'Rao', 'Reddy', 'Shah', 'Singh', 'Verma')
+CITIES = ('Mumbai', 'Pune', 'Delhi', 'Bengaluru', 'Chennai', 'Kolkata', 'Hyderabad', 'Ahmedabad')
+CATEGORIES = ('Chocolate', 'Truffles', 'Cookies', 'Gift Boxes', 'Seasonal')
+SIZES = ('SMALL', 'MEDIUM', 'LARGE')
+FLAVOURS = ('Dark', 'Milk', 'White', 'Hazelnut', 'Almond', 'Caramel', 'Orange', 'Mint', 'Coffee', 'Sea Salt')
+STATUS_WEIGHTS = (('pending', 3), ('paid', 6), ('cancelled', 1))
+
+
+def paise(value):
+    return Decimal(value).scaleb(-2)
+
+
+def make_images(count, rng):
+    # Small distinct PNGs; the content-addressed storage names them by digest
+    names = []
+    for index in range(count):
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), colour).save(buffer, 'PNG')
+        names.append(storage.media_storage().save(f'sample_{index}.png', ContentFile(buffer.getvalue())))
+    return names
+
+
+def lookup(model, names):
+    return [model.objects.get_or_create(name=name)[0] for name in names]
+
+
+def make_customers(count, rng, batch_size):
+    offset = Customer.objects.count()
+    customers = []
+    for index in range(offset, offset + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        customers.append(Customer(
+            name=f"{first} {last} {index}",
+            email=f"{first.lower()}.{last.lower()}{index}@example.com",
+            phone=f"9{index:09d}",
+            address=f"{rng.randrange(1, 500)} {rng.choice(LAST_NAMES)} Road, {rng.choice(CITIES)}",
+        ))
+    created = Customer.objects.bulk_create(customers, batch_size=batch_size)
+    search.index_objects('customer', created)
+    return created
+
+
+def make_products(count, rng, images, batch_size):
+    categories = lookup(Category, CATEGORIES)
+    sizes = lookup(Size, SIZES)
+    offset = Product.objects.count()
+    products = []
+    for index in range(offset, offset + count):
+        size = rng.choice(sizes)
+        name = f"{rng.choice(FLAVOURS)} {rng.choice(CATEGORIES)} {index}"
+        cost = rng.randrange(2000, 40000)
+        products.append(Product(
+            name=name,
+            display_name=f"{name} - {size.name}",  # as Product.save() would set it
+            category=rng.choice(categories),
+            size=size,
+            cost_price=paise(cost),
+            sell_price=paise(int(cost * rng.uniform(1.2, 2.0))),
+            image=rng.choice(images) if images else None,
+        ))
+    created = Product.objects.bulk_create(products, batch_size=batch_size)
+    search.index_objects('product', created)
+    return created
+
+
+def make_orders(count, rng, customer_ids, products, images, days, batch_size):
+    # Figures are filled in the way Order.save() and the payment ledger would
+    statuses = [status for status, weight in STATUS_WEIGHTS for _ in range(weight)]
+    now = timezone.now()
+    created = 0
+    while created < count:
+        orders = []
+        for _ in range(min(batch_size, count - created)):
+            product = rng.choice(products)
+            quantity = rng.randrange(1, 10)
+            delivery = paise(rng.randrange(0, 10000))
+            other = paise(rng.randrange(0, 2000))
+            total = product.sell_price * quantity + delivery
+            received = rng.choice((Decimal(0), total, (total / 2).quantize(Decimal('0.01'))))
+            if received <= 0:
+                payment_status = 'pending'
+            elif received >= total:
+                payment_status = 'full_paid'
+            else:
+                payment_status = 'partial_paid'
+            orders.append(Order(
+                customer_id=rng.choice(customer_ids),
+                product_id=product.pk,
+                quantity=quantity,
+                unit_sell_price=product.sell_price,
+                unit_cost_price=product.cost_price,
+                delivery_cost=delivery,
+                other_expense=other,
+                total=total,
+                received_amount=received,
+                pending_amount=total - received,
+                profit_amount=(product.sell_price - product.cost_price) * quantity - other,
+                order_status=rng.choice(statuses),
+                payment_status=payment_status,
+                created_at=now - timedelta(seconds=rng.randrange(days * 24 * 3600)),
+                image=rng.choice(images) if images and rng.random() < 0.2 else None,
+            ))
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+            Payment.objects.bulk_create(
+                [Payment(order=order, amount=order.received_amount, payment_date=order.created_at,
+                         method=rng.choice(('cash', 'upi', 'card')))
+                 for order in orders if order.received_amount > 0],
+                batch_size=batch_size,
+            )
+        created += len(orders)
+    return created
+
+
+def generate(customers=1000, products=50, orders=10000, images=10, days=365, seed=0, batch_size=BATCH_SIZE):
+    # Adds to whatever is already in the database; derived tables are rebuilt at the end
+    rng = random.Random(seed)
+    image_names = make_images(images, rng)
+    make_customers(customers, rng, batch_size)
+    make_products(products, rng, image_names, batch_size)
+    customer_ids = list(Customer.objects.values_list('pk', flat=True))
+    product_rows = list(Product.objects.only('pk', 'sell_price', 'cost_price'))
+    if orders and (not customer_ids or not product_rows):
+        raise ValueError("Orders need at least one customer and one product.")
+    created = make_orders(orders, rng, customer_ids, product_rows, image_names, days, batch_size)
+
+    # bulk_create skips the signals that keep these in step
+    rollups.rebuild()
+    storage.recount()
+    report_cache.invalidate_all()
+    for name in image_names:
+        ensure_thumbnails(Product(image=name).image)
+    return {'customers': customers, 'products': products, 'orders': created, 'images': len(image_names)}
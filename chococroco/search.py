@@ -0,0 +1,110 @@
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Collate
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+from .models import Customer, Product
+
+# kind -> (model, indexed fields); each kind has its own table, keyed by the object's id
+DOCUMENTS = {
+    'customer': (Customer, ('name', 'phone', 'email', 'address')),
+    'product': (Product, ('name', 'display_name')),
+}
+
+MIN_TERM_LENGTH = 3  # trigram matching needs at least three characters
+
+
+def table(kind):
+    return f"chococroco_search_{kind}"
+
+
+def supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def document(kind, obj):
+    _, fields = DOCUMENTS[kind]
+    return ' '.join(str(value) for value in (getattr(obj, field) for field in fields) if value)
+
+
+def index_object(kind, obj):
+    if not supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {table(kind)} WHERE rowid = %s", [obj.pk])
+            cursor.execute(f"INSERT INTO {table(kind)} (rowid, body) VALUES (%s, %s)", [obj.pk, document(kind, obj)])
+        else:
+            cursor.execute(
+                f"INSERT INTO {table(kind)} (object_id, body) VALUES (%s, %s) "
+                f"ON CONFLICT (object_id) DO UPDATE SET body = EXCLUDED.body",
+                [obj.pk, document(kind, obj)],
+            )
+
+
+def index_objects(kind, objs):
+    # Bulk variant for freshly bulk_created rows (no existing entries to replace)
+    if not supported() or not objs:
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'object_id'
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {table(kind)} ({column}, body) VALUES (%s, %s)",
+                           [(obj.pk, document(kind, obj)) for obj in objs])
+
+
+def remove_object(kind, pk):
+    if not supported():
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'object_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table(kind)} WHERE {column} = %s", [pk])
+
+
+def rebuild(kind, batch_size=1000):
+    model, fields = DOCUMENTS[kind]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table(kind)}")
+    for obj in model.objects.only('pk', *fields).iterator(chunk_size=batch_size):
+        index_object(kind, obj)
+
+
+def match_sql(kind, term):
+    # (sql, params) selecting the ids of matching objects, or None when the index can't answer
+    words = term.split()
+    if not supported() or not words or any(len(word) < MIN_TERM_LENGTH for word in words):
+        return None
+    if connection.vendor == 'sqlite':
+        query = ' AND '.join('"%s"' % word.replace('"', '""') for word in words)
+        return f"SELECT rowid FROM {table(kind)} WHERE {table(kind)} MATCH %s", [query]
+    like = ' AND '.join(['body ILIKE %s'] * len(words))
+    patterns = ['%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%' for word in words]
+    return (f"SELECT object_id FROM {table(kind)} "
+            f"WHERE document @@ plainto_tsquery('simple', %s) OR ({like})", [term] + patterns)
+
+
+def matching(kind, term, field='pk'):
+    # Q for rows whose `field` points at a matching object, or None
+    match = match_sql(kind, term)
+    if match is None:
+        return None
+    return Q(**{f"{field}__in": RawSQL(*match)})
+
+
+def fold(term):
+    # Lowercases ASCII only, as SQLite's NOCASE collation (and LIKE) do
+    return ''.join(chr(ord(char) + 32) if 'A' <= char <= 'Z' else char for char in term)
+
+
+def prefix_match(field, term):
+    # Case-insensitive "starts with" that the prefix indexes (migration 0015) can answer. On PostgreSQL
+    # istartswith is UPPER(field::text) LIKE, which the text_pattern_ops index serves as is; SQLite won't
+    # use an index for Django's LIKE ... ESCAPE, so there it's a range over the NOCASE-collated column.
+    if connection.vendor != 'sqlite' or not term:
+        return Q(**{f"{field}__istartswith": term})
+    term = fold(term)
+    column = Collate(F(field), 'NOCASE')
+    match = Q(GreaterThanOrEqual(column, term))
+    if term[-1] < chr(0x10ffff):
+        match &= Q(LessThan(column, term[:-1] + chr(ord(term[-1]) + 1)))
+    return match
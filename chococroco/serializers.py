@@ -0,0 +1,255 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import invoice_cache, ledger, report_cache, rollups, search
+from .models import Category, Customer, Order, Payment, Product, Size
+
+BATCH_SIZE = 500
+MAX_BULK_ITEMS = 1000
+
+
+def requested_fields(request):
+    # Field names listed in ?fields=, or None for all of them
+    value = request.query_params.get('fields') if request is not None else None
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SparseFieldsMixin:
+    # ?fields=id,total trims what reads return; writes still accept every field
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = requested_fields(request)
+        if fields and request.method in ('GET', 'HEAD'):
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class PreloadedPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    # In bulk writes the id is looked up in rows loaded once for the whole list, not with a get() per item
+    def to_internal_value(self, data):
+        loaded = self.context.get('preloaded', {}).get(self.field_name)
+        if loaded is None:
+            return super().to_internal_value(data)
+        pk = as_id(data)
+        if pk is None or isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in loaded:
+            self.fail('does_not_exist', pk_value=data)
+        return loaded[pk]
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    # many=True writes: one transaction, rows written in batches, derived data brought up to date per batch.
+    # Subclasses fill in prepare() and the created()/updated() hooks the signals would otherwise run.
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', MAX_BULK_ITEMS)
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            preloaded = self.context.setdefault('preloaded', {})
+            for name, field in self.child.fields.items():
+                if isinstance(field, PreloadedPrimaryKeyField) and not field.read_only:
+                    ids = {as_id(item.get(name)) for item in data if isinstance(item, dict)} - {None}
+                    preloaded[name] = field.get_queryset().in_bulk(ids)
+            self._instances = iter(self.instance) if self.instance is not None else None
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        # Bulk updates: each item is validated against the row it updates
+        if self.instance is not None:
+            self.child.instance = next(self._instances)
+        return super().run_child_validation(data)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        objs = [model(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            for start in range(0, len(objs), BATCH_SIZE):
+                batch = objs[start:start + BATCH_SIZE]
+                self.prepare(batch)
+                model.objects.bulk_create(batch)
+                self.created(batch)
+        return objs
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            for start in range(0, len(instances), BATCH_SIZE):
+                batch = instances[start:start + BATCH_SIZE]
+                before = [self.stored(obj) for obj in batch]
+                fields = set()
+                for obj, attrs in zip(batch, validated_data[start:start + BATCH_SIZE]):
+                    for name, value in attrs.items():
+                        setattr(obj, name, value)
+                    fields.update(attrs)
+                if not fields:
+                    continue
+                fields.update(self.prepare(batch) or ())
+                model.objects.bulk_update(batch, list(fields))
+                self.updated(batch, before)
+        return instances
+
+    def stored(self, obj):
+        return None
+
+    def prepare(self, objs):
+        # Fills in computed fields before writing; returns the extra field names it set
+        return ()
+
+    def created(self, objs):
+        pass
+
+    def updated(self, objs, before):
+        pass
+
+
+class CustomerListSerializer(BulkListSerializer):
+    def stored(self, obj):
+        return (obj.name, obj.address)
+
+    def created(self, objs):
+        search.index_objects('customer', objs)
+
+    def updated(self, objs, before):
+        for obj in objs:
+            search.index_object('customer', obj)
+        renamed = [obj.pk for obj, old in zip(objs, before) if old != (obj.name, obj.address)]
+        if renamed:
+            orders = Order.objects.filter(customer__in=renamed)
+            invoice_cache.invalidate(orders.values_list('pk', flat=True))
+            report_cache.invalidate_orders(orders)
+
+
+class ProductListSerializer(BulkListSerializer):
+    def stored(self, obj):
+        return (obj.name, obj.display_name, obj.category_id)
+
+    def prepare(self, objs):
+        for obj in objs:
+            obj.set_display_name()
+        return ('display_name',)
+
+    def created(self, objs):
+        search.index_objects('product', objs)
+
+    def updated(self, objs, before):
+        for obj in objs:
+            search.index_object('product', obj)
+        recategorised = [obj.pk for obj, old in zip(objs, before) if old[2] != obj.category_id]
+        if recategorised:
+            rollups.rebuild(products=recategorised)
+        renamed = [obj.pk for obj, old in zip(objs, before) if old != (obj.name, obj.display_name, obj.category_id)]
+        if renamed:
+            orders = Order.objects.filter(product__in=renamed)
+            invoice_cache.invalidate(orders.values_list('pk', flat=True))
+            report_cache.invalidate_orders(orders)
+
+
+class OrderListSerializer(BulkListSerializer):
+    def stored(self, obj):
+        return rollups.order_contribution(obj)
+
+    def prepare(self, objs):
+        now = timezone.now()
+        for obj in objs:
+            obj.compute_totals()
+            if obj.pk is not None:
+                obj.updated_at = now  # bulk_update skips auto_now
+        # Not pending_amount: the instances' received_amount may be stale, so updated() settles the balance
+        return ('unit_sell_price', 'unit_cost_price', 'total', 'profit_amount', 'updated_at')
+
+    def created(self, objs):
+        touched = rollups.apply_changes((None, rollups.order_contribution(obj)) for obj in objs)
+        report_cache.invalidate_days(key['day'] for key in touched)
+
+    def updated(self, objs, before):
+        # Pending amount and payment status from the stored received amount, as Order.save() does
+        orders = Order.objects.filter(pk__in=[obj.pk for obj in objs])
+        orders.update(**ledger.balance_fields())
+        balances = {pk: values for pk, *values in orders.values_list('pk', *Order.LEDGER_FIELDS)}
+        for obj in objs:
+            for name, value in zip(Order.LEDGER_FIELDS, balances[obj.pk]):
+                setattr(obj, name, value)
+        touched = rollups.apply_changes(zip(before, (rollups.order_contribution(obj) for obj in objs)))
+        invoice_cache.invalidate([obj.pk for obj in objs])
+        report_cache.invalidate_days([old[0]['day'] for old in before] + [key['day'] for key in touched])
+
+
+class PaymentListSerializer(BulkListSerializer):
+    def create(self, validated_data):
+        payments = [Payment(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            ledger.import_payments(payments, batch_size=BATCH_SIZE)
+        return payments
+
+    def stored(self, obj):
+        return (obj.order_id, obj.amount)
+
+    def updated(self, objs, before):
+        # Net change per order, applied with the ledger's atomic updates
+        changes = defaultdict(Decimal)
+        for obj, (order_id, amount) in zip(objs, before):
+            changes[order_id] -= amount
+            changes[obj.order_id] += Decimal(obj.amount)
+        for order_id, amount in changes.items():
+            ledger.apply_payment(order_id, amount)
+        report_cache.invalidate_orders(Order.objects.filter(pk__in=[pk for pk, amount in changes.items() if amount]))
+
+
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Customer
+        fields = ('id', 'name', 'email', 'phone', 'address')
+        list_serializer_class = CustomerListSerializer
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    category = PreloadedPrimaryKeyField(queryset=Category.objects.all(), allow_null=True, required=False)
+    size = PreloadedPrimaryKeyField(queryset=Size.objects.all(), allow_null=True, required=False)
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'display_name', 'category', 'size', 'cost_price', 'sell_price', 'image')
+        read_only_fields = ('display_name', 'image')
+        list_serializer_class = ProductListSerializer
+
+
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    customer = PreloadedPrimaryKeyField(queryset=Customer.objects.all())
+    customer_name = serializers.CharField(source='customer.name', read_only=True)
+    product = PreloadedPrimaryKeyField(queryset=Product.objects.all())
+    product_name = serializers.CharField(source='product.display_name', read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'customer', 'customer_name', 'product', 'product_name', 'quantity', 'unit_sell_price',
+                  'unit_cost_price', 'delivery_cost', 'other_expense', 'total', 'received_amount', 'pending_amount',
+                  'profit_amount', 'order_status', 'payment_status', 'created_at', 'updated_at', 'image')
+        # Prices, totals and balances follow from the product and the payments
+        read_only_fields = ('unit_sell_price', 'unit_cost_price', 'total', 'received_amount', 'pending_amount',
+                            'profit_amount', 'payment_status', 'updated_at', 'image')
+        list_serializer_class = OrderListSerializer
+
+
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    order = PreloadedPrimaryKeyField(queryset=Order.objects.all())
+
+    class Meta:
+        model = Payment
+        fields = ('id', 'order', 'amount', 'method', 'payment_date')
+        list_serializer_class = PaymentListSerializer
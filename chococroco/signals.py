@@ -0,0 +1,185 @@
+import logging
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import invoice_cache, ledger, report_cache, rollups, search, storage, thumbnails
+from .models import Category, Customer, Order, Payment, Product
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_PRODUCT_FIELDS = ('category_id',)
+INVOICE_PRODUCT_FIELDS = ('name', 'display_name')
+INVOICE_CUSTOMER_FIELDS = ('name', 'address')
+REPORT_PRODUCT_FIELDS = ('name', 'display_name', 'category_id')
+REPORT_CUSTOMER_FIELDS = ('name',)
+
+
+def stored_values(model, instance, fields, raw):
+    # Field values currently in the database, read before the row is overwritten
+    if raw or instance.pk is None:
+        return None
+    return model.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+def changed(before, instance, fields):
+    return before is not None and any(before[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_contribution(sender, instance, raw=False, **kwargs):
+    # Order.save() runs in one transaction, which holds this row's lock through the post_save rollup update
+    instance._rollup_before = None if raw or instance.pk is None else rollups.stored_contribution(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rollups.order_changed(getattr(instance, '_rollup_before', None), rollups.order_contribution(instance))
+
+
+@receiver(post_delete, sender=Order)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollups.order_changed(rollups.order_contribution(instance), None)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def drop_cached_invoice(sender, instance, **kwargs):
+    invoice_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Order)
+def drop_cached_reports_on_save(sender, instance, raw=False, **kwargs):
+    # Entries covering the day the order was on and the day it is on now
+    if raw:
+        return
+    before = getattr(instance, '_rollup_before', None)
+    report_cache.invalidate_days([before[0]['day'] if before else None, rollups.order_day(instance.created_at)])
+
+
+@receiver(post_delete, sender=Order)
+def drop_cached_reports_on_delete(sender, instance, **kwargs):
+    report_cache.invalidate_days([rollups.order_day(instance.created_at)])
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_fields(sender, instance, raw=False, **kwargs):
+    fields = set(ROLLUP_PRODUCT_FIELDS + INVOICE_PRODUCT_FIELDS + REPORT_PRODUCT_FIELDS + ('image',))
+    instance._stored_before = stored_values(Product, instance, fields, raw)
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    before = getattr(instance, '_stored_before', None)
+    if raw or before is None:
+        return
+    if changed(before, instance, ROLLUP_PRODUCT_FIELDS):
+        rollups.rebuild(products=[instance.pk])
+    if changed(before, instance, INVOICE_PRODUCT_FIELDS):
+        invoice_cache.invalidate(Order.objects.filter(product=instance).values_list('pk', flat=True))
+    if changed(before, instance, REPORT_PRODUCT_FIELDS):
+        report_cache.invalidate_orders(Order.objects.filter(product=instance))
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created=False, raw=False, **kwargs):
+    # Category names appear in the cached analytics
+    if not raw and not created:
+        report_cache.invalidate_orders(Order.objects.filter(product__category=instance))
+
+
+@receiver(pre_save, sender=Customer)
+def remember_customer_fields(sender, instance, raw=False, **kwargs):
+    fields = set(INVOICE_CUSTOMER_FIELDS + REPORT_CUSTOMER_FIELDS)
+    instance._stored_before = stored_values(Customer, instance, fields, raw)
+
+
+@receiver(post_save, sender=Customer)
+def customer_changed(sender, instance, raw=False, **kwargs):
+    before = getattr(instance, '_stored_before', None)
+    if raw or before is None:
+        return
+    if changed(before, instance, INVOICE_CUSTOMER_FIELDS):
+        invoice_cache.invalidate(Order.objects.filter(customer=instance).values_list('pk', flat=True))
+    if changed(before, instance, REPORT_CUSTOMER_FIELDS):
+        report_cache.invalidate_orders(Order.objects.filter(customer=instance))
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment(sender, instance, raw=False, **kwargs):
+    before = stored_values(Payment, instance, ('order_id', 'amount'), raw)
+    instance._ledger_before = (before['order_id'], before['amount']) if before else None
+
+
+@receiver(post_save, sender=Payment)
+def apply_payment_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ledger.payment_changed(getattr(instance, '_ledger_before', None), (instance.order_id, instance.amount))
+
+
+@receiver(post_delete, sender=Payment)
+def apply_payment_on_delete(sender, instance, **kwargs):
+    ledger.payment_changed((instance.order_id, instance.amount), None)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def drop_cached_reports_for_payment(sender, instance, raw=False, **kwargs):
+    # Received / pending amounts of the order (or both orders, if the payment moved) are on the report rows
+    if raw:
+        return
+    before = getattr(instance, '_ledger_before', None)
+    order_ids = {instance.order_id, before[0] if before else None} - {None}
+    created = Order.objects.filter(pk__in=order_ids).values_list('created_at', flat=True)
+    report_cache.invalidate_days(rollups.order_day(created_at) for created_at in created)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_object(sender._meta.model_name, instance)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_object(sender._meta.model_name, instance.pk)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Product)
+def create_thumbnails(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        thumbnails.ensure_thumbnails(instance.image)
+    except OSError:
+        logger.exception("Could not create thumbnails for %s", instance.image.name)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_image(sender, instance, raw=False, **kwargs):
+    instance._stored_image = stored_values(Order, instance, ('image',), raw)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Product)
+def count_image_references(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_stored_image' if sender is Order else '_stored_before', None)
+    old = before['image'] if before else None
+    new = instance.image.name or None
+    if old != new:
+        storage.add_reference(new)
+        storage.remove_reference(old)
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Product)
+def release_image(sender, instance, **kwargs):
+    storage.remove_reference(instance.image.name)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Count, F
+
+CHUNK_SIZE = 1024 * 1024
+BLOB_DIR = 'images'  # shared by order and product uploads so identical files are stored once
+
+_reserved = threading.local()  # references _save() took for uploads whose rows aren't saved yet
+
+
+def file_digest(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_name(digest, extension):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{extension.lower()}"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # Stores each upload as images/<sha256[:2]>/<sha256><ext> whatever its upload_to;
+    # identical uploads share one file instead of getting a new name.
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = file_digest(content.chunks(CHUNK_SIZE))
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        target = content_name(digest, os.path.splitext(name)[1])
+        # The upload's reference is taken first, so a delete of the last other row can't remove the file
+        # between here and the row's post_save
+        reserve(target)
+        if not self.exists(target):
+            self.write(target, content)
+        return target
+
+    def write(self, name, content):
+        # Through a temporary file: a concurrent upload of the same content replaces it with identical bytes
+        # instead of failing (FileSystemStorage._save would retry the unchanged name forever)
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        handle, partial = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(partial, self.file_permissions_mode)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+
+_storage = None
+
+
+def media_storage():
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
+
+
+def image_models():
+    from .models import Order, Product
+    return (Order, Product)
+
+
+def reservations():
+    if not hasattr(_reserved, 'names'):
+        _reserved.names = Counter()
+    return _reserved.names
+
+
+def reserve(name):
+    # One reference for an upload in progress, under the blob row's lock (see delete_file)
+    from .models import MediaBlob
+    with transaction.atomic():
+        blob, created = MediaBlob.objects.select_for_update().get_or_create(name=name, defaults={'refcount': 1})
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+    reservations()[name] += 1
+
+
+def add_reference(name):
+    from .models import MediaBlob
+    if not name:
+        return
+    reserved = reservations()
+    if reserved[name]:
+        reserved[name] -= 1  # taken by the upload's _save()
+        return
+    if not MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+        storage = media_storage()
+        size = storage.size(name) if storage.exists(name) else 0
+        blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size, 'refcount': 1})
+        if not created:
+            MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+
+def remove_reference(name):
+    # Deletes the file once no row points at it any more
+    from .models import MediaBlob
+    if not name:
+        return
+    MediaBlob.objects.filter(name=name).update(refcount=F('refcount') - 1)
+    if MediaBlob.objects.filter(name=name, refcount__lte=0).exists():
+        transaction.on_commit(lambda: delete_file(name))
+
+
+def delete_file(name):
+    # With the blob row locked, so an upload reusing the file (reserve()) waits for the delete or prevents it
+    from .models import MediaBlob
+    from .thumbnails import SIZES, thumbnail_path
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+        if blob is not None and blob.refcount > 0:
+            return  # referenced again in the meantime
+        media_storage().delete(name)
+        for size in SIZES:
+            try:
+                os.remove(thumbnail_path(name, size))
+            except FileNotFoundError:
+                pass
+        if blob is not None:
+            blob.delete()
+
+
+def recount():
+    # Rebuild every reference count from the rows that use the files
+    from .models import MediaBlob
+    counts = {}
+    for model in image_models():
+        rows = model.objects.exclude(image='').exclude(image__isnull=True).values('image').annotate(n=Count('pk'))
+        for row in rows.iterator():
+            counts[row['image']] = counts.get(row['image'], 0) + row['n']
+    storage = media_storage()
+    reservations().clear()  # counted from the rows themselves
+    with transaction.atomic():
+        MediaBlob.objects.exclude(name__in=counts).delete()
+        for name, count in counts.items():
+            size = storage.size(name) if storage.exists(name) else 0
+            MediaBlob.objects.update_or_create(name=name, defaults={'refcount': count, 'size': size})
+    return counts
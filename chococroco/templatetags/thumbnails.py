@@ -0,0 +1,10 @@
+from django import template
+
+from chococroco.thumbnails import thumbnail_url as _thumbnail_url
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_url(fieldfile, size='small'):
+    return _thumbnail_url(fieldfile, size)
@@ -0,0 +1,17 @@
+from django.test import TransactionTestCase
+
+from . import ledger
+from .management.commands.check_concurrency import add_payments
+from .models import Order, Payment
+
+
+class ConcurrentPaymentTests(TransactionTestCase):
+    # Real commits from several threads: on SQLite this needs the file test database from settings
+    threads = 8
+    payments = 25
+
+    def test_threaded_payment_inserts(self):
+        failures, _ = add_payments(self.threads, self.payments, orders=3)
+        self.assertEqual(failures, [])
+        self.assertEqual(Payment.objects.count(), self.threads * self.payments)
+        self.assertEqual(ledger.out_of_sync(Order.objects.all()).count(), 0)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+SIZES = {
+    'small': (100, 100),  # changelist and report previews (shown at 50x50)
+    'medium': (400, 400),
+}
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+THUMBNAIL_DIR = 'thumbnails'
+
+
+def thumbnail_name(image_name, size):
+    # Uploaded names are never reused by the storage, so the name identifies the content
+    digest = hashlib.sha1(image_name.encode()).hexdigest()
+    return f"{size}/{digest[:2]}/{digest}.{EXTENSION}"
+
+
+def thumbnail_path(image_name, size):
+    return os.path.join(settings.MEDIA_ROOT, THUMBNAIL_DIR, thumbnail_name(image_name, size))
+
+
+def render(source, destination, dimensions):
+    # Pure Pillow so it can run in a worker process without Django
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(dimensions)
+        if image.mode not in ('RGB', 'RGBA') or FORMAT == 'JPEG':
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # A temporary name of its own, so two processes rendering the same thumbnail never share a file
+        handle, tmp = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.thumbnail-')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                image.save(output, FORMAT, quality=80)
+            os.chmod(tmp, 0o644)  # mkstemp makes it owner-only; the web server serves it from MEDIA_ROOT
+            os.replace(tmp, destination)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return destination
+
+
+def render_all(source, targets):
+    # targets: [(destination, dimensions)]; returns how many were written
+    written = 0
+    for destination, dimensions in targets:
+        if not os.path.exists(destination):
+            render(source, destination, dimensions)
+            written += 1
+    return written
+
+
+def missing_targets(image_name):
+    return [(thumbnail_path(image_name, size), dimensions) for size, dimensions in SIZES.items()
+            if not os.path.exists(thumbnail_path(image_name, size))]
+
+
+def ensure_thumbnails(fieldfile):
+    if not fieldfile:
+        return 0
+    targets = missing_targets(fieldfile.name)
+    if not targets or not os.path.exists(fieldfile.path):
+        return 0
+    return render_all(fieldfile.path, targets)
+
+
+def thumbnail_url(fieldfile, size='small'):
+    # Falls back to the original upload until the thumbnail exists. Served from MEDIA_URL by the web server;
+    # names never change content, so the front end can cache MEDIA_URL/thumbnails/ for a year (see README)
+    if not fieldfile:
+        return ''
+    if os.path.exists(thumbnail_path(fieldfile.name, size)):
+        return f"{settings.MEDIA_URL}{THUMBNAIL_DIR}/{thumbnail_name(fieldfile.name, size)}"
+    return fieldfile.url
@@ -1,5 +1,6 @@
-from django.urls import path
+from django.urls import include, path
 from . import views
+from .api import router
 
 urlpatterns = [
     # Orders section
@@ -9,5 +10,18 @@ urlpatterns = [
 
     # Reports section
     path('reports/', views.order_report, name='order_report'),
+    path('reports/export.xlsx', views.order_report_xlsx, name='order_report_xlsx'),
+    path('reports/profit-loss/', views.profit_loss_summary, name='profit_loss_summary'),
+    path('reports/analytics/', views.analytics_report, name='analytics_report'),
+    path('reports/analytics.json', views.analytics_data, name='analytics_data'),
+    path('reports/request-stats/', views.request_stats, name='request_stats'),
+
+    # Background jobs
+    path('jobs/<int:pk>/', views.job_progress, name='job_progress'),
+    path('jobs/<int:pk>/status.json', views.job_status, name='job_status'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job_download'),
+
+    # REST API
+    path('api/', include(router.urls)),
     # path('reports/export/', views.export_orders_csv, name='export_orders_csv'),
 ]
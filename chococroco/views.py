@@ -1,31 +1,152 @@
-from django.shortcuts import render
-from django.db.models import Sum, F
-from .models import Order
+import csv
+import os
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from .exports import report_sheets, xlsx_response
+from .models import Job, Order
+from .reports import filter_orders, order_page, report_db
+from . import jobs, profiling, report_cache, rollups
 
 def order_report(request):
-    # Filters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    status = request.GET.get('status')
+    # Filters, normalized so equivalent requests share cache entries
+    filters = report_cache.normalize(request.GET.get('start_date'), request.GET.get('end_date'),
+                                     request.GET.get('status'))
+    cursor = request.GET.get('after')
 
-    orders = Order.objects.all()
+    # Aggregations, read from the daily rollup
+    totals = report_cache.get_or_set('totals', filters, lambda: rollups.sales_totals(*filters))
 
-    if start_date:
-        orders = orders.filter(created_at__date__gte=start_date)
-    if end_date:
-        orders = orders.filter(created_at__date__lte=end_date)
-    if status:
-        orders = orders.filter(order_status=status)
-
-    # Aggregations
-    total_sales = orders.aggregate(total=Sum('total'))['total'] or 0
-    total_profit = orders.aggregate(total=Sum('profit_amount'))['total'] or 0
-    total_cost = sum(o.cost_total() for o in orders)
+    # Current page of rows, keyset paginated and cached as rendered HTML
+    def render_rows():
+        orders = filter_orders(Order.objects.using(report_db()), *filters)
+        page, next_cursor = order_page(orders, cursor)
+        return render_to_string("reports/order_rows.html", {"orders": page}), next_cursor
+    rows_html, next_cursor = report_cache.get_or_set('rows', filters, render_rows, cursor)
 
     return render(request, "reports/order_report.html", {
-        "orders": orders,
-        "total_sales": total_sales,
-        "total_profit": total_profit,
-        "total_cost": total_cost,
-        "filters": {"start_date": start_date, "end_date": end_date, "status": status}
+        "rows_html": rows_html,
+        "next_cursor": next_cursor,
+        "is_first_page": not cursor,
+        "order_count": totals["order_count"],
+        "total_sales": totals["total_sales"],
+        "total_profit": totals["total_profit"],
+        "total_cost": totals["total_cost"],
+        "filters": report_cache.params(filters),
+    })
+
+def order_report_xlsx(request):
+    # The order report's filter set as a workbook: summary sheet from aggregates, then every matching order
+    filters = report_cache.normalize(request.GET.get('start_date'), request.GET.get('end_date'),
+                                     request.GET.get('status'))
+    orders = filter_orders(Order.objects.using(report_db()), *filters)
+    count = orders.count()
+    if not jobs.inline(count):
+        if not request.user.is_staff:
+            # Too large to answer here, and only staff may queue background jobs
+            return redirect_to_login(request.get_full_path(), reverse('admin:login'))
+        return jobs.start(request, 'order_report_xlsx', count, **report_cache.params(filters))
+    return xlsx_response(report_sheets(orders, report_cache.params(filters)), 'order_report.xlsx')
+
+def visible_job(request, pk):
+    job = get_object_or_404(Job, pk=pk)
+    if not jobs.visible(request, job):
+        raise Http404("No such job.")
+    return job
+
+def job_progress(request, pk):
+    # Polls job_status until the worker is done, then offers the file
+    job = visible_job(request, pk)
+    return render(request, "reports/job_progress.html", {"job": job, "title": jobs.title(job.kind)})
+
+def job_status(request, pk):
+    job = visible_job(request, pk)
+    response = JsonResponse({
+        "id": job.pk,
+        "title": jobs.title(job.kind),
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "percent": job.percent,
+        "message": job.message,
+        "download_url": reverse('job_download', args=[job.pk]) if job.status == 'done' else None,
     })
+    patch_cache_control(response, no_store=True)
+    return response
+
+def job_download(request, pk):
+    job = visible_job(request, pk)
+    if job.status != 'done':
+        raise Http404("The job has not finished.")
+    try:
+        handle = open(jobs.artifact_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404("The file has been removed.")
+    return FileResponse(handle, as_attachment=True, filename=os.path.basename(job.artifact))
+
+def profit_loss_summary(request):
+    # Monthly P&L per category, straight from the daily rollup; bad dates and statuses mean "no filter"
+    start_date, end_date, status = report_cache.normalize(request.GET.get('start_date'),
+                                                          request.GET.get('end_date'), request.GET.get('status'))
+
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename=profit_loss_summary.csv'
+    writer = csv.writer(response)
+    writer.writerow(['Month', 'Category', 'Orders', 'Quantity', 'Revenue', 'Cost', 'Profit'])
+    for row in rollups.monthly_profit_loss(start_date, end_date, status):
+        writer.writerow([row['month'].strftime('%Y-%m'), row['category__name'] or '', row['orders'],
+                         row['quantity'], str(row['revenue']), str(row['cost']), str(row['profit'])])
+    return response
+
+def analytics_summary(request):
+    # Grouped metrics over the filtered orders, computed column-wise with pandas (imported on first use)
+    from . import analytics
+    filters = report_cache.normalize(request.GET.get('start_date'), request.GET.get('end_date'),
+                                     request.GET.get('status'))
+    period = request.GET.get('period')
+    if period not in analytics.PERIODS:
+        period = 'month'
+
+    def compute():
+        orders = filter_orders(Order.objects.using(report_db()), *filters)
+        return analytics.summary(analytics.order_frame(orders), period)
+    data = report_cache.get_or_set('analytics', filters, compute, period)
+    return data, dict(report_cache.params(filters), period=period)
+
+def analytics_report(request):
+    from . import analytics
+    data, filters = analytics_summary(request)
+    return render(request, "reports/analytics.html", {
+        "data": data,
+        "periods": list(analytics.PERIODS),
+        "filters": filters,
+    })
+
+def analytics_data(request):
+    data, filters = analytics_summary(request)
+    return JsonResponse(dict(data, filters=filters))
+
+@staff_member_required
+def request_stats(request):
+    # Latency / query percentiles per URL name and admin action, from the ring buffer or the flushed sink
+    if request.method == 'POST':
+        count = profiling.flush()
+        messages.success(request, f"Flushed {count} entries to {settings.REQUEST_STATS_SINK}.")
+        return HttpResponseRedirect(request.path)
+    source = 'sink' if request.GET.get('source') == 'sink' else 'buffer'
+    entries = profiling.load_sink() if source == 'sink' else profiling.entries()
+    return render(request, "admin/request_stats.html", dict(
+        admin.site.each_context(request),
+        title="Request stats",
+        source=source,
+        entry_count=len(entries),
+        sample_rate=settings.REQUEST_STATS_SAMPLE_RATE,
+        stats=profiling.summarise(entries),
+        report_cache=report_cache.stats(),
+    ))
@@ -17,10 +17,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
+    'django_filters',
     'chococroco',
 ]
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'chococroco.profiling.RequestStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -45,12 +48,60 @@ TEMPLATES = [
     },
 ]
 WSGI_APPLICATION = 'chococroco_order_mgmt.wsgi.application'
-DATABASES = {
-    'default': {
+# Database profile from the environment: DATABASE_ENGINE=sqlite (default) or postgresql.
+# 'reports' is a read-only connection to the same data, used by the report and analytics queries.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))  # seconds a connection is reused across requests
+
+if DATABASE_ENGINE == 'postgresql':
+    # psycopg2 has no driver-side pool: connections persist per worker; put PgBouncer in front for more
+    POSTGRES = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DATABASE_NAME', 'chococroco'),
+        'USER': os.environ.get('DATABASE_USER', 'chococroco'),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+        'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        # PgBouncer in transaction mode cannot keep the server-side cursors .iterator() uses
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_PGBOUNCER') == '1',
+        'OPTIONS': {'connect_timeout': 5},
+    }
+    DATABASES = {
+        'default': POSTGRES,
+        'reports': dict(
+            POSTGRES,
+            HOST=os.environ.get('DATABASE_REPORTS_HOST', POSTGRES['HOST']),  # e.g. a streaming replica
+            OPTIONS=dict(POSTGRES['OPTIONS'], options='-c default_transaction_read_only=on'),
+            TEST={'MIRROR': 'default'},
+        ),
+    }
+else:
+    # WAL lets reports read while admin saves write; IMMEDIATE transactions take the write lock up front, so
+    # concurrent writers wait out busy_timeout instead of failing with "database is locked"
+    SQLITE_PRAGMAS = (f"PRAGMA busy_timeout = {int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000))}; "
+                      f"PRAGMA synchronous = {os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')};")
+    SQLITE = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('DATABASE_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': f"PRAGMA journal_mode = WAL; {SQLITE_PRAGMAS}",
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # A file rather than Django's in-memory default, so threaded tests lock it the way production does
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
+    }
+    DATABASES = {
+        'default': SQLITE,
+        'reports': dict(
+            SQLITE,
+            OPTIONS={'init_command': f"{SQLITE_PRAGMAS} PRAGMA query_only = ON;"},
+            TEST={'MIRROR': 'default'},
+        ),
     }
-}
 AUTH_PASSWORD_VALIDATORS = []
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -58,7 +109,49 @@ USE_I18N = True
 USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Processes used for bulk invoice rendering (None = one per CPU)
+INVOICE_WORKERS = None
+
+# Rendered invoices kept under MEDIA_ROOT/invoice_cache, least recently used removed first
+INVOICE_CACHE_MAX_BYTES = 200 * 1024 * 1024
 
+# Background jobs, run by `python manage.py run_jobs`; files kept under MEDIA_ROOT/jobs
+JOBS_INLINE_MAX_ROWS = 500  # bigger export / invoice / report selections are queued (None = always in the request)
+JOBS_WORKER_THREADS = 2  # jobs one worker runs at once
+JOBS_STALE_AFTER = 300  # seconds without a worker heartbeat before a running job is queued again
+JOBS_KEEP_DAYS = 7  # finished jobs and their files are removed after this
+
+# Per-request latency / query stats, shown at /reports/request-stats/ (staff only)
+REQUEST_STATS_SAMPLE_RATE = 0.1  # fraction of requests recorded; 0 turns it off
+REQUEST_STATS_BUFFER_SIZE = 5000  # in-process ring buffer, oldest entries dropped first
+REQUEST_STATS_FLUSH_EVERY = 0  # flush to the sink when the buffer holds this many (0 = only on demand)
+REQUEST_STATS_SINK = os.path.join(BASE_DIR, 'request_stats.jsonl')  # or a .sqlite3 file
+REQUEST_STATS_DUPLICATE_THRESHOLD = 5  # same query shape this often in one request counts as N+1
+REQUEST_STATS_WATCH = ('order_report', 'analytics_', 'admin:chococroco_order_')
+
+# Order report / analytics results keyed by their filters, dropped by signals when orders in the range change.
+# On disk so every worker process, run_jobs and management commands share the entries and their invalidations
+# (or point it at a shared backend such as Redis).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'report_cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+
+# REST API at /api/ for staff accounts (HTTP Basic for sync jobs, the session for the browsable API)
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAdminUser'],
+}
 
 JAZZMIN_SETTINGS = {
     "site_title": "Chococroco Admin",